@@ -13,8 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
+
 import sqlalchemy as sa
 
+from oslo_config import cfg
 from oslo_utils import uuidutils
 
 from neutron.db import common_db_mixin
@@ -27,13 +30,34 @@ from neutron.i18n import _LW
 
 from oslo_log import log
 from sqlalchemy import orm
+from sqlalchemy import sql
 from sqlalchemy.orm import exc
 
 from networking_bgpvpn.neutron.extensions import bgpvpn as bgpvpn_ext
+from networking_bgpvpn.neutron.services.common import cache
 from networking_bgpvpn.neutron.services.common import utils
 
 LOG = log.getLogger(__name__)
 
+bgpvpn_db_opts = [
+    cfg.IntOpt('cache_size', default=1000,
+               help=_('Maximum number of BGPVPNs kept in the process-local '
+                      'cache of the BGPVPN database layer. Set it to 0 to '
+                      'disable the cache.')),
+    cfg.IntOpt('cache_ttl', default=10,
+               help=_('Number of seconds after which a cached BGPVPN is '
+                      'read again from the database.')),
+]
+cfg.CONF.register_opts(bgpvpn_db_opts, 'bgpvpn')
+
+# Number of bgpvpns loaded per query when iterating over all bgpvpns
+ITER_CHUNK_SIZE = 500
+
+# BGPVPN attributes whose values are stored as rows of the
+# bgpvpn_route_targets table, the attribute name being used as the row kind
+RT_KINDS = ('route_targets', 'import_targets', 'export_targets',
+            'route_distinguishers')
+
 
 class BGPVPNNetAssociation(model_base.BASEV2):
     """Represents the association between a bgpvpn and a network."""
@@ -47,25 +71,137 @@ class BGPVPNNetAssociation(model_base.BASEV2):
                            primary_key=True)
 
 
+class BGPVPNRouteTarget(model_base.BASEV2):
+    """Represents a route target or route distinguisher of a bgpvpn."""
+    __tablename__ = 'bgpvpn_route_targets'
+
+    bgpvpn_id = sa.Column(sa.String(36),
+                          sa.ForeignKey('bgpvpns.id', ondelete="CASCADE"),
+                          primary_key=True)
+    kind = sa.Column(sa.Enum(*RT_KINDS, name="bgpvpn_rt_kinds"),
+                     primary_key=True)
+    value = sa.Column(sa.String(255), primary_key=True, index=True)
+    # rank of the value among the values of its kind, which are returned
+    # in the order they were given
+    position = sa.Column(sa.Integer(), nullable=False, server_default='0')
+
+
 class BGPVPN(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     """Represents a BGPVPN Object."""
     name = sa.Column(sa.String(255))
     type = sa.Column(sa.Enum("l2", "l3",
                              name="bgpvpn_type"),
                      nullable=False)
-    route_targets = sa.Column(sa.String(255), nullable=False)
-    import_targets = sa.Column(sa.String(255), nullable=False)
-    export_targets = sa.Column(sa.String(255), nullable=False)
-    route_distinguishers = sa.Column(sa.String(255), nullable=False)
     auto_aggregate = sa.Column(sa.Boolean(), nullable=False)
-    networks = orm.relationship(models_v2.Network,
-                                secondary=BGPVPNNetAssociation.__tablename__,
-                                lazy='joined')
+    # bumped by every write to the bgpvpn, its route targets or its network
+    # associations
+    revision = sa.Column(sa.BigInteger(), nullable=False, default=0,
+                         server_default='0')
+    rt_entries = orm.relationship(BGPVPNRouteTarget,
+                                  order_by=BGPVPNRouteTarget.position,
+                                  cascade='all, delete-orphan',
+                                  lazy='subquery')
 
 
 class BGPVPNPluginDb(common_db_mixin.CommonDbMixin):
     """BGPVPN service plugin database class using SQLAlchemy models."""
 
+    # process-wide cache of (revision, bgpvpn dict without its networks)
+    # tuples, shared by all the instances so that any write invalidates it
+    _bgpvpn_cache = None
+
+    @classmethod
+    def get_bgpvpn_cache(cls):
+        if cls._bgpvpn_cache is None:
+            cls._bgpvpn_cache = cache.LRUCache(cfg.CONF.bgpvpn.cache_size,
+                                               cfg.CONF.bgpvpn.cache_ttl)
+        return cls._bgpvpn_cache
+
+    def _bump_revision(self, context, ids):
+        (context.session.query(BGPVPN).
+         filter(BGPVPN.id.in_(ids)).
+         update({'revision': BGPVPN.revision + 1},
+                synchronize_session=False))
+
+    def get_bgpvpn_revision(self, context, id):
+        """Get the current revision of a bgpvpn, None if it does not exist"""
+        return (context.session.query(BGPVPN.revision).
+                filter(BGPVPN.id == id).scalar())
+
+    def _get_revision_and_network_ids(self, context, id):
+        """Get the revision of a bgpvpn and the ids of its networks
+
+        The revision is None if the bgpvpn does not exist.
+        """
+        query = (context.session.query(BGPVPN.revision,
+                                       models_v2.Network.id).
+                 outerjoin(BGPVPNNetAssociation,
+                           BGPVPNNetAssociation.bgpvpn_id == BGPVPN.id).
+                 outerjoin(models_v2.Network,
+                           models_v2.Network.id ==
+                           BGPVPNNetAssociation.network_id).
+                 filter(BGPVPN.id == id))
+        revision = None
+        network_ids = []
+        for revision, network_id in query:
+            if network_id:
+                network_ids.append(network_id)
+        return revision, network_ids
+
+    def _invalidate_bgpvpns(self, ids):
+        bgpvpn_cache = self.get_bgpvpn_cache()
+        for id in ids:
+            bgpvpn_cache.invalidate(id)
+
+    def _apply_filters_to_query(self, query, model, filters, context=None):
+        # route target lists are not columns of the bgpvpns table, filter
+        # them through the value index of the bgpvpn_route_targets table
+        if model is BGPVPN and filters:
+            filters = dict(filters)
+            for kind in RT_KINDS:
+                if kind not in filters:
+                    continue
+                values = filters.pop(kind)
+                if not values:
+                    # like the base class, an empty filter matches nothing
+                    query = query.filter(sql.false())
+                    continue
+                rt_query = (query.session.query(BGPVPNRouteTarget.bgpvpn_id).
+                            filter(BGPVPNRouteTarget.kind == kind,
+                                   BGPVPNRouteTarget.value.in_(values)))
+                query = query.filter(BGPVPN.id.in_(rt_query.subquery()))
+        return super(BGPVPNPluginDb, self)._apply_filters_to_query(
+            query, model, filters, context)
+
+    def _set_rt_entries(self, bgpvpn_db, kind, values):
+        """Replace the bgpvpn route targets of a given kind
+
+        Entries whose value is kept are reused so that only the added and
+        removed values turn into INSERT and DELETE statements, and the moved
+        ones into UPDATE statements of their position.
+        """
+        # (bgpvpn_id, kind, value) is the primary key, drop duplicates
+        # while keeping the order of the values
+        unique_values = []
+        for value in utils.rtrd_str2list(values):
+            if value not in unique_values:
+                unique_values.append(value)
+        values = unique_values
+        others = []
+        existing = {}
+        for entry in bgpvpn_db.rt_entries:
+            if entry.kind == kind:
+                existing[entry.value] = entry
+            else:
+                others.append(entry)
+        entries = []
+        for position, value in enumerate(values):
+            entry = existing.get(value) or BGPVPNRouteTarget(kind=kind,
+                                                             value=value)
+            entry.position = position
+            entries.append(entry)
+        bgpvpn_db.rt_entries = others + entries
+
     def _get_bgpvpns_for_tenant(self, session, tenant_id, fields):
         try:
             qry = session.query(BGPVPN)
@@ -73,27 +209,58 @@ class BGPVPNPluginDb(common_db_mixin.CommonDbMixin):
         except exc.NoResultFound:
             return
 
-        return [self._make_bgpvpn_dict(bgpvpn, fields=fields)
+        return self._make_bgpvpn_dicts(session, bgpvpns, fields=fields)
+
+    def _apply_fields_to_query(self, query, fields):
+        # route targets are only worth loading when one of them is requested
+        if fields and not any(kind in fields for kind in RT_KINDS):
+            query = query.options(orm.noload(BGPVPN.rt_entries))
+        return query
+
+    def _get_network_ids(self, session, bgpvpn_ids):
+        """Get the network ids associated to each of the given bgpvpns
+
+        Only the association table is read: the join on networks merely
+        leaves out associations to networks which have been deleted
+        without the database enforcing the foreign key cascade.
+        """
+        net_ids = dict((bgpvpn_id, []) for bgpvpn_id in bgpvpn_ids)
+        if not net_ids:
+            return net_ids
+
+        query = (session.query(BGPVPNNetAssociation.bgpvpn_id,
+                               BGPVPNNetAssociation.network_id).
+                 join(models_v2.Network,
+                      models_v2.Network.id ==
+                      BGPVPNNetAssociation.network_id).
+                 filter(BGPVPNNetAssociation.bgpvpn_id.in_(list(net_ids))))
+        for bgpvpn_id, network_id in query:
+            net_ids[bgpvpn_id].append(network_id)
+        return net_ids
+
+    def _make_bgpvpn_dicts(self, session, bgpvpns, fields=None):
+        bgpvpns = list(bgpvpns)
+        net_ids = {}
+        if not fields or 'networks' in fields:
+            net_ids = self._get_network_ids(
+                session, [bgpvpn['id'] for bgpvpn in bgpvpns])
+        return [self._make_bgpvpn_dict(bgpvpn, fields=fields,
+                                       networks=net_ids.get(bgpvpn['id']))
                 for bgpvpn in bgpvpns]
 
-    def _make_bgpvpn_dict(self, bgpvpn, fields=None):
-        net_list = [net.id for net in bgpvpn['networks']]
+    def _make_bgpvpn_dict(self, bgpvpn, fields=None, networks=None):
         res = {
             'id': bgpvpn['id'],
             'tenant_id': bgpvpn['tenant_id'],
-            'networks': net_list,
+            'networks': networks or [],
             'name': bgpvpn['name'],
             'type': bgpvpn['type'],
-            'route_targets':
-                utils.rtrd_str2list(bgpvpn['route_targets']),
-            'route_distinguishers':
-                utils.rtrd_str2list(bgpvpn['route_distinguishers']),
-            'import_targets':
-                utils.rtrd_str2list(bgpvpn['import_targets']),
-            'export_targets':
-                utils.rtrd_str2list(bgpvpn['export_targets']),
             'auto_aggregate': bgpvpn['auto_aggregate']
         }
+        if not fields or any(kind in fields for kind in RT_KINDS):
+            res.update((kind, []) for kind in RT_KINDS)
+            for entry in bgpvpn['rt_entries']:
+                res[entry.kind].append(entry.value)
         return self._fields(res, fields)
 
     def create_bgpvpn(self, context, bgpvpn):
@@ -102,11 +269,6 @@ class BGPVPNPluginDb(common_db_mixin.CommonDbMixin):
         # Check that route_targets is not empty
         if (not bgpvpn['route_targets']):
             raise bgpvpn_ext.BGPVPNMissingRouteTarget
-        else:
-            rt = utils.rtrd_list2str(bgpvpn['route_targets'])
-            i_rt = utils.rtrd_list2str(bgpvpn['import_targets'])
-            e_rt = utils.rtrd_list2str(bgpvpn['export_targets'])
-            rd = utils.rtrd_list2str(bgpvpn.get('route_distinguishers', ''))
 
         tenant_id = self._get_tenant_id_for_create(context, bgpvpn)
 
@@ -116,19 +278,56 @@ class BGPVPNPluginDb(common_db_mixin.CommonDbMixin):
                 tenant_id=tenant_id,
                 name=bgpvpn['name'],
                 type=bgpvpn['type'],
-                route_targets=rt,
-                import_targets=i_rt,
-                export_targets=e_rt,
-                route_distinguishers=rd,
                 auto_aggregate=bgpvpn['auto_aggregate']
             )
+            for kind in RT_KINDS:
+                self._set_rt_entries(bgpvpn_db, kind, bgpvpn.get(kind))
             context.session.add(bgpvpn_db)
 
         return self._make_bgpvpn_dict(bgpvpn_db)
 
-    def get_bgpvpns(self, context, filters=None, fields=None):
-        return self._get_collection(context, BGPVPN, self._make_bgpvpn_dict,
-                                    filters=filters, fields=fields)
+    def create_bgpvpns(self, context, bgpvpns):
+        """Create several bgpvpns in a single transaction"""
+        with context.session.begin(subtransactions=True):
+            return [self.create_bgpvpn(context, bgpvpn) for bgpvpn in bgpvpns]
+
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'bgpvpn', limit, marker)
+        query = self._get_collection_query(context, BGPVPN, filters=filters,
+                                           sorts=sorts, limit=limit,
+                                           marker_obj=marker_obj,
+                                           page_reverse=page_reverse)
+        query = self._apply_fields_to_query(query, fields)
+        bgpvpns = self._make_bgpvpn_dicts(context.session, query,
+                                          fields=fields)
+        if limit and page_reverse:
+            bgpvpns.reverse()
+        return bgpvpns
+
+    def iter_bgpvpns(self, context, filters=None, fields=None,
+                     chunk_size=ITER_CHUNK_SIZE):
+        """Iterate over bgpvpns, loading them in chunks of chunk_size
+
+        Unlike get_bgpvpns, the whole collection is never held in memory:
+        chunks are read in id order, each query starting after the last
+        bgpvpn of the previous chunk, and converted only when consumed.
+        """
+        marker_obj = None
+        while True:
+            query = self._get_collection_query(context, BGPVPN,
+                                               filters=filters,
+                                               sorts=[('id', True)],
+                                               limit=chunk_size,
+                                               marker_obj=marker_obj)
+            query = self._apply_fields_to_query(query, fields)
+            bgpvpns_db = query.all()
+            for bgpvpn in self._make_bgpvpn_dicts(context.session,
+                                                  bgpvpns_db, fields=fields):
+                yield bgpvpn
+            if len(bgpvpns_db) < chunk_size:
+                return
+            marker_obj = bgpvpns_db[-1]
 
     def _get_bgpvpn(self, context, id):
         try:
@@ -137,9 +336,34 @@ class BGPVPNPluginDb(common_db_mixin.CommonDbMixin):
             raise bgpvpn_ext.BGPVPNNotFound(id=id)
 
     def get_bgpvpn(self, context, id, fields=None):
-        bgpvpn_db = self._get_bgpvpn(context, id)
         LOG.debug("get_bgpvpn called with fields = %s" % fields)
-        return self._make_bgpvpn_dict(bgpvpn_db, fields)
+        bgpvpn_cache = self.get_bgpvpn_cache()
+        # the cached copy may have been made stale by a write from another
+        # neutron-server worker, check it against the revision of the row,
+        # read along with the associated networks in a single query
+        revision, network_ids = self._get_revision_and_network_ids(context,
+                                                                   id)
+        if revision is None:
+            bgpvpn_cache.invalidate(id)
+            raise bgpvpn_ext.BGPVPNNotFound(id=id)
+
+        cached = bgpvpn_cache.get(id,
+                                  valid=lambda cached: cached[0] == revision)
+        if cached is None:
+            bgpvpn = self._make_bgpvpn_dict(self._get_bgpvpn(context, id))
+            # networks may be deleted without going through this class,
+            # so associations are always read from the database
+            del bgpvpn['networks']
+            bgpvpn_cache.set(id, (revision, bgpvpn))
+        else:
+            bgpvpn = cached[1]
+            if (not context.is_admin and
+                    bgpvpn['tenant_id'] != context.tenant_id):
+                raise bgpvpn_ext.BGPVPNNotFound(id=id)
+
+        bgpvpn = copy.deepcopy(bgpvpn)
+        bgpvpn['networks'] = network_ids
+        return self._fields(bgpvpn, fields)
 
     def update_bgpvpn(self, context, id, bgpvpn):
         bgpvpn = bgpvpn['bgpvpn']
@@ -149,64 +373,145 @@ class BGPVPNPluginDb(common_db_mixin.CommonDbMixin):
         with context.session.begin(subtransactions=True):
             bgpvpn_db = self._get_bgpvpn(context, id)
             if bgpvpn:
-                # Format Route Target lists to string
-                if 'route_targets' in bgpvpn:
-                    rt = utils.rtrd_list2str(bgpvpn['route_targets'])
-                    bgpvpn['route_targets'] = rt
-                if 'import_targets' in bgpvpn:
-                    i_rt = utils.rtrd_list2str(bgpvpn['import_targets'])
-                    bgpvpn['import_targets'] = i_rt
-                if 'export_targets' in bgpvpn:
-                    e_rt = utils.rtrd_list2str(bgpvpn['export_targets'])
-                    bgpvpn['export_targets'] = e_rt
-                if 'route_distinguishers' in bgpvpn:
-                    rd = utils.rtrd_list2str(bgpvpn['route_distinguishers'])
-                    bgpvpn['route_distinguishers'] = rd
+                bgpvpn = bgpvpn.copy()
+                # Route Target lists are stored in their own table
+                for kind in RT_KINDS:
+                    if kind in bgpvpn:
+                        self._set_rt_entries(bgpvpn_db, kind,
+                                             bgpvpn.pop(kind))
 
                 bgpvpn_db.update(bgpvpn)
-        return self._make_bgpvpn_dict(bgpvpn_db, fields)
+            bgpvpn_db.revision = BGPVPN.revision + 1
+        self._invalidate_bgpvpns([id])
+        return self._make_bgpvpn_dicts(context.session, [bgpvpn_db],
+                                       fields=fields)[0]
 
     def delete_bgpvpn(self, context, id):
         with context.session.begin(subtransactions=True):
             bgpvpn_db = self._get_bgpvpn(context, id)
-            bgpvpn = self._make_bgpvpn_dict(bgpvpn_db)
+            bgpvpn = self._make_bgpvpn_dicts(context.session, [bgpvpn_db])[0]
+            (context.session.query(BGPVPNNetAssociation).
+             filter(BGPVPNNetAssociation.bgpvpn_id == id).
+             delete(synchronize_session=False))
             context.session.delete(bgpvpn_db)
+        self._invalidate_bgpvpns([id])
         return bgpvpn
 
+    def delete_bgpvpns(self, context, ids):
+        """Delete several bgpvpns in a single transaction"""
+        ids = list(ids)
+        with context.session.begin(subtransactions=True):
+            bgpvpns_db = (context.session.query(BGPVPN).
+                          filter(BGPVPN.id.in_(ids)).all())
+            found_ids = set(bgpvpn_db['id'] for bgpvpn_db in bgpvpns_db)
+            for id in ids:
+                if id not in found_ids:
+                    raise bgpvpn_ext.BGPVPNNotFound(id=id)
+            bgpvpns = self._make_bgpvpn_dicts(context.session, bgpvpns_db)
+            (context.session.query(BGPVPNNetAssociation).
+             filter(BGPVPNNetAssociation.bgpvpn_id.in_(ids)).
+             delete(synchronize_session=False))
+            for bgpvpn_db in bgpvpns_db:
+                context.session.delete(bgpvpn_db)
+        self._invalidate_bgpvpns(ids)
+        return bgpvpns
+
     def find_bgpvpns_for_network(self, context, network_id):
         LOG.debug("find_bgpvpns_for_network() called for "
                   "network %s" % network_id)
-        try:
-            query = (context.session.query(BGPVPN).
-                     join(BGPVPNNetAssociation).
-                     filter(BGPVPNNetAssociation.network_id == network_id))
-        except exc.NoResultFound:
-            return
-
-        return [self._make_bgpvpn_dict(bvc) for bvc in query.all()]
+        return self.find_bgpvpns_for_networks(context,
+                                              [network_id])[network_id]
+
+    def find_bgpvpns_for_networks(self, context, network_ids):
+        """Find the bgpvpns associated to each of the given networks
+
+        Returns a dict mapping each network id to the list of its bgpvpns,
+        the bgpvpns of all the networks being retrieved at once.
+        """
+        LOG.debug("find_bgpvpns_for_networks() called for "
+                  "networks %s" % network_ids)
+        bgpvpns_for_net = dict((network_id, []) for network_id in network_ids)
+        if not bgpvpns_for_net:
+            return bgpvpns_for_net
+
+        query = (context.session.query(BGPVPN,
+                                       BGPVPNNetAssociation.network_id).
+                 join(BGPVPNNetAssociation).
+                 filter(BGPVPNNetAssociation.network_id.in_(
+                     list(bgpvpns_for_net))))
+        rows = query.all()
+
+        bgpvpns_db = dict((bgpvpn_db['id'], bgpvpn_db)
+                          for bgpvpn_db, _network_id in rows)
+        bgpvpns = dict(
+            (bgpvpn['id'], bgpvpn) for bgpvpn in
+            self._make_bgpvpn_dicts(context.session, bgpvpns_db.values()))
+        for bgpvpn_db, network_id in rows:
+            bgpvpns_for_net[network_id].append(bgpvpns[bgpvpn_db['id']])
+        return bgpvpns_for_net
+
+    def get_associated_network_ids(self, context):
+        """Get the ids of all the networks associated to a bgpvpn"""
+        query = (context.session.query(BGPVPNNetAssociation.network_id).
+                 distinct())
+        return set(network_id for (network_id,) in query)
+
+    def get_bgpvpn_revisions_for_networks(self, context, network_ids):
+        """Get the revisions of the bgpvpns associated to the given networks
+
+        Returns a dict mapping each network id to the frozenset of the
+        (bgpvpn id, revision) tuples of its bgpvpns, which changes whenever
+        one of them is updated, associated or disassociated.
+        """
+        revisions = dict((network_id, set()) for network_id in network_ids)
+        if not revisions:
+            return {}
+
+        query = (context.session.query(BGPVPNNetAssociation.network_id,
+                                       BGPVPN.id, BGPVPN.revision).
+                 join(BGPVPN, BGPVPN.id == BGPVPNNetAssociation.bgpvpn_id).
+                 filter(BGPVPNNetAssociation.network_id.in_(
+                     list(revisions))))
+        for network_id, bgpvpn_id, revision in query:
+            revisions[network_id].add((bgpvpn_id, revision))
+        return dict((network_id, frozenset(bgpvpn_revisions))
+                    for network_id, bgpvpn_revisions in revisions.items())
 
     def associate_network(self, context, bgpvpn_id, network_id):
-        LOG.info(_LI("associating network %s"), network_id)
         if not network_id:
             return
+        self.associate_networks(context, bgpvpn_id, [network_id])
+
+    def associate_networks(self, context, bgpvpn_id, network_ids):
+        LOG.info(_LI("associating networks %s"), network_ids)
+        if not network_ids:
+            return
         with context.session.begin(subtransactions=True):
-            net_assoc = BGPVPNNetAssociation(bgpvpn_id=bgpvpn_id,
-                                             network_id=network_id)
-            context.session.add(net_assoc)
+            context.session.execute(
+                BGPVPNNetAssociation.__table__.insert(),
+                [{'bgpvpn_id': bgpvpn_id, 'network_id': network_id}
+                 for network_id in network_ids])
+            self._bump_revision(context, [bgpvpn_id])
+        self._invalidate_bgpvpns([bgpvpn_id])
 
     def disassociate_network(self, context, bgpvpn_id, network_id):
-        LOG.info(_LI("disassociating network %s"), network_id)
         if not network_id:
             return
-        with context.session.begin():
-            try:
-                assocs = (context.session.query(BGPVPNNetAssociation).
-                          filter(BGPVPNNetAssociation.network_id ==
-                                 network_id))
-            except exc.NoResultFound:
-                LOG.warning(_LW("network %(net_id)s was not associated to"
-                                " bgpvpn %(bgpvpn_id)s"),
-                            {'net_id': network_id,
-                             'bgpvpn_id': bgpvpn_id})
-                return
-            assocs.delete()
+        self.disassociate_networks(context, bgpvpn_id, [network_id])
+
+    def disassociate_networks(self, context, bgpvpn_id, network_ids):
+        LOG.info(_LI("disassociating networks %s"), network_ids)
+        if not network_ids:
+            return
+        with context.session.begin(subtransactions=True):
+            count = (context.session.query(BGPVPNNetAssociation).
+                     filter(BGPVPNNetAssociation.bgpvpn_id == bgpvpn_id,
+                            BGPVPNNetAssociation.network_id.in_(network_ids)).
+                     delete(synchronize_session=False))
+            self._bump_revision(context, [bgpvpn_id])
+        self._invalidate_bgpvpns([bgpvpn_id])
+        if count < len(network_ids):
+            LOG.warning(_LW("some of networks %(net_ids)s were not associated"
+                            " to bgpvpn %(bgpvpn_id)s"),
+                        {'net_ids': network_ids,
+                         'bgpvpn_id': bgpvpn_id})
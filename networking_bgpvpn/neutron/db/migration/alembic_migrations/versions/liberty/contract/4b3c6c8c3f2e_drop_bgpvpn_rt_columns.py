@@ -0,0 +1,66 @@
+# Copyright 2015 Orange
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""move bgpvpn route targets to bgpvpn_route_targets table
+Revision ID: 4b3c6c8c3f2e
+Revises: 180baa4183e0
+Create Date: 2015-11-02 10:12:45.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4b3c6c8c3f2e'
+down_revision = '180baa4183e0'
+depends_on = ('8c8a4e5e1d3b',)
+
+RT_KINDS = ('route_targets', 'import_targets', 'export_targets',
+            'route_distinguishers')
+
+bgpvpns = sa.Table('bgpvpns', sa.MetaData(),
+                   sa.Column('id', sa.String(36)),
+                   *[sa.Column(kind, sa.String(255)) for kind in RT_KINDS])
+
+bgpvpn_route_targets = sa.Table('bgpvpn_route_targets', sa.MetaData(),
+                                sa.Column('bgpvpn_id', sa.String(36)),
+                                sa.Column('kind', sa.String(32)),
+                                sa.Column('value', sa.String(255)),
+                                sa.Column('position', sa.Integer()))
+
+
+def upgrade():
+    rt_entries = []
+    for row in op.get_bind().execute(bgpvpns.select()):
+        for kind in RT_KINDS:
+            values = getattr(row, kind)
+            if not values:
+                continue
+            # (bgpvpn_id, kind, value) is the primary key, drop duplicates
+            # while keeping the order of the values
+            unique_values = []
+            for value in values.split(','):
+                if value not in unique_values:
+                    unique_values.append(value)
+            rt_entries.extend({'bgpvpn_id': row.id,
+                               'kind': kind,
+                               'value': value,
+                               'position': position}
+                              for position, value in enumerate(unique_values))
+    if rt_entries:
+        op.bulk_insert(bgpvpn_route_targets, rt_entries)
+
+    for kind in RT_KINDS:
+        op.drop_column('bgpvpns', kind)
@@ -0,0 +1,33 @@
+# Copyright 2015 Orange
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add revision column to bgpvpns
+Revision ID: 2f3c5e6a9b1d
+Revises: 8c8a4e5e1d3b
+Create Date: 2015-11-09 14:27:03.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '2f3c5e6a9b1d'
+down_revision = '8c8a4e5e1d3b'
+
+
+def upgrade():
+    op.add_column('bgpvpns',
+                  sa.Column('revision', sa.BigInteger(), nullable=False,
+                            server_default='0'))
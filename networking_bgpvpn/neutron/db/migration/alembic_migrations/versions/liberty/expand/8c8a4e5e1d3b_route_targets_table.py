@@ -0,0 +1,48 @@
+# Copyright 2015 Orange
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add bgpvpn_route_targets table
+Revision ID: 8c8a4e5e1d3b
+Revises: 17d9fd4fddee
+Create Date: 2015-11-02 10:12:45.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8c8a4e5e1d3b'
+down_revision = '17d9fd4fddee'
+
+rt_kinds = sa.Enum('route_targets', 'import_targets', 'export_targets',
+                   'route_distinguishers', name='bgpvpn_rt_kinds')
+
+
+def upgrade():
+    op.create_table(
+        'bgpvpn_route_targets',
+        sa.Column('bgpvpn_id', sa.String(36), nullable=False),
+        sa.Column('kind', rt_kinds, nullable=False),
+        sa.Column('value', sa.String(255), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.ForeignKeyConstraint(['bgpvpn_id'], ['bgpvpns.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('bgpvpn_id', 'kind', 'value'),
+        mysql_default_charset='utf8',
+        mysql_engine='InnoDB'
+    )
+    op.create_index(op.f('ix_bgpvpn_route_targets_value'),
+                    'bgpvpn_route_targets', ['value'], unique=False)
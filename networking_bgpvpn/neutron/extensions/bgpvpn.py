@@ -182,7 +182,8 @@ class Bgpvpn(extensions.ExtensionDescriptor):
                                                    constants.BGPVPN,
                                                    action_map=action_map,
                                                    register_quota=True,
-                                                   translate_name=True)
+                                                   translate_name=True,
+                                                   allow_bulk=True)
 
     @classmethod
     def get_plugin_interface(cls):
@@ -216,7 +217,8 @@ class BGPVPNPluginBase(ServicePluginBase):
         pass
 
     @abc.abstractmethod
-    def get_bgpvpns(self, context, filters=None, fields=None):
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
         pass
 
     @abc.abstractmethod
@@ -0,0 +1,78 @@
+# Copyright (c) 2015 Orange.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+import time
+
+
+class LRUCache(object):
+    """Size bounded LRU cache whose entries expire after a time to live
+
+    A size of 0 disables the cache, a ttl of 0 or None keeps entries until
+    they are evicted or invalidated. Hits and misses are counted.
+    """
+
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None, valid=None):
+        """Get the value of an entry
+
+        An entry whose value does not pass the optional valid check, like
+        an expired one, is dropped and counted as a miss.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if (entry is None or
+                    (entry[1] is not None and entry[1] <= time.time()) or
+                    (valid is not None and not valid(entry[0]))):
+                self.misses += 1
+                return default
+            # re-insert the entry as the most recently used one
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from neutron.api.v2 import attributes as attr
 from neutron.common import exceptions as n_exc
 from neutron.db import servicetype_db as st_db
 from neutron.i18n import _LI
@@ -30,6 +31,7 @@ LOG = log.getLogger(__name__)
 class BGPVPNPlugin(BGPVPNPluginBase):
     supported_extension_aliases = ["bgpvpn"]
     path_prefix = "/bgpvpn"
+    __native_bulk_support = True
 
     def __init__(self):
         super(BGPVPNPlugin, self).__init__()
@@ -48,19 +50,40 @@ class BGPVPNPlugin(BGPVPNPluginBase):
                  default_provider)
         self.driver = drivers[default_provider]
 
+        # Let the API layer delegate sorting and pagination to the driver
+        # when it can do it natively
+        self.__native_sorting_support = self.driver.native_sorting_support
+        self.__native_pagination_support = (
+            self.driver.native_pagination_support)
+
         if len(drivers) > 1:
             LOG.warning(_LI("Multiple drivers configured for BGPVPN, although"
                             "running multiple drivers in parallel is not yet"
                             "supported"))
 
     def _validate_network_body(self, context, bgpvpn_id, network_body):
-        # Check that the tenant of the network is the same as the tenant of the
-        # bgpvpn resource
-        if (not network_body or 'network_id' not in network_body):
+        # Check that the network(s) given either as a single network_id or
+        # as a list of network ids exist, and return them
+        if (not network_body or not network_body.get('network_id')):
             msg = 'no network specified'
             raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
+        network_ids = network_body['network_id']
+        if not isinstance(network_ids, list):
+            network_ids = [network_ids]
+        for network_id in network_ids:
+            msg = attr._validate_uuid(network_id)
+            if msg:
+                raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
+        network_ids = sorted(set(network_ids), key=network_ids.index)
+
         plugin = manager.NeutronManager.get_plugin()
-        return plugin.get_network(context, network_body['network_id'])
+        nets = plugin.get_networks(context, filters={'id': network_ids},
+                                   fields=['id', 'tenant_id'])
+        found_ids = set(net['id'] for net in nets)
+        for network_id in network_ids:
+            if network_id not in found_ids:
+                raise n_exc.NetworkNotFound(net_id=network_id)
+        return nets
 
     def get_plugin_type(self):
         return constants.BGPVPN
@@ -71,8 +94,18 @@ class BGPVPNPlugin(BGPVPNPluginBase):
     def create_bgpvpn(self, context, bgpvpn):
         return self.driver.create_bgpvpn(context, bgpvpn)
 
-    def get_bgpvpns(self, context, filters=None, fields=None):
-        return self.driver.get_bgpvpns(context, filters, fields)
+    def create_bgpvpn_bulk(self, context, bgpvpns):
+        return self.driver.create_bgpvpn_bulk(context, bgpvpns)
+
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
+        kwargs = {}
+        if self.driver.native_sorting_support:
+            kwargs['sorts'] = sorts
+        if self.driver.native_pagination_support:
+            kwargs.update(limit=limit, marker=marker,
+                          page_reverse=page_reverse)
+        return self.driver.get_bgpvpns(context, filters, fields, **kwargs)
 
     def get_bgpvpn(self, context, id, fields=None):
         return self.driver.get_bgpvpn(context, id, fields)
@@ -83,15 +116,23 @@ class BGPVPNPlugin(BGPVPNPluginBase):
     def delete_bgpvpn(self, context, id):
         self.driver.delete_bgpvpn(context, id)
 
-    def associate_network(self, context, id, network_body):
-        net = self._validate_network_body(context, id, network_body)
-        bgpvpn = self.get_bgpvpn(context, id)
-        if not net['tenant_id'] == bgpvpn['tenant_id']:
-            msg = 'network doesn\'t belong to the bgpvpn owner'
-            raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
+    def delete_bgpvpn_bulk(self, context, ids):
+        self.driver.delete_bgpvpn_bulk(context, ids)
 
-        self.driver.associate_network(context, id, net['id'])
+    def associate_network(self, context, id, network_body):
+        nets = self._validate_network_body(context, id, network_body)
+        # Check that the tenant of the networks is the same as the tenant of
+        # the bgpvpn resource
+        bgpvpn = self.get_bgpvpn(context, id, fields=['tenant_id'])
+        for net in nets:
+            if not net['tenant_id'] == bgpvpn['tenant_id']:
+                msg = 'network doesn\'t belong to the bgpvpn owner'
+                raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
+
+        self.driver.associate_networks(context, id,
+                                       [net['id'] for net in nets])
 
     def disassociate_network(self, context, id, network_body):
-        net = self._validate_network_body(context, id, network_body)
-        self.driver.disassociate_network(context, id, net['id'])
+        nets = self._validate_network_body(context, id, network_body)
+        self.driver.disassociate_networks(context, id,
+                                          [net['id'] for net in nets])
@@ -13,26 +13,73 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import copy
+import hashlib
+import json
+import threading
+import time
+
+import eventlet
+
 from sqlalchemy.orm import exc
 from sqlalchemy import sql
 
 from neutron import context as n_context
-from neutron import manager
 
 from neutron.callbacks import events
 from neutron.callbacks import registry
 from neutron.callbacks import resources
 from neutron.common import constants as const
+from neutron.common import rpc as n_rpc
 from neutron.db import models_v2
+from neutron.i18n import _
+from neutron.i18n import _LE
+from neutron.plugins.ml2 import models as ml2_models
+from oslo_config import cfg
 from oslo_log import log as logging
 
+from networking_bgpvpn.neutron.services.common import cache
 from networking_bgpvpn.neutron.services.common import utils
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe import rpc
 from networking_bgpvpn.neutron.services.service_drivers import driver_api
 
-from networking_bagpipe_l2.agent.bgpvpn import rpc_client
-
 LOG = logging.getLogger(__name__)
 
+bagpipe_bgpvpn_opts = [
+    cfg.IntOpt('cache_size', default=10000,
+               help=_('Maximum number of entries of each of the caches of '
+                      'the BaGPipe BGPVPN driver.')),
+    cfg.IntOpt('vpn_networks_refresh_interval', default=10,
+               help=_('Number of seconds after which the set of networks '
+                      'associated to a BGPVPN, used to ignore port events '
+                      'on other networks, is read again from the database. '
+                      'It catches up with associations made by other '
+                      'neutron-server workers.')),
+    cfg.FloatOpt('port_notification_window', default=0,
+                 help=_('Number of seconds during which port attach and '
+                        'detach notifications to a given agent host are '
+                        'buffered before being sent, a later event on a '
+                        'port superseding a pending one. 0 disables the '
+                        'buffering.')),
+    cfg.IntOpt('duplicate_notification_ttl', default=30,
+               help=_('Number of seconds during which an update_bgpvpn '
+                      'notification identical to the last one sent to an '
+                      'agent, for the same revision of the BGPVPN, is not '
+                      'sent again. It bounds the memory used to remember '
+                      'the notifications sent. 0 disables the suppression '
+                      'of duplicate notifications.')),
+    cfg.IntOpt('port_notification_batch_size', default=100,
+               help=_('Maximum number of ports buffered for a given agent '
+                      'host before the notifications are sent without '
+                      'waiting for the end of port_notification_window.')),
+]
+cfg.CONF.register_opts(bagpipe_bgpvpn_opts, 'bagpipe_bgpvpn')
+
+# Port attributes whose update needs to be reflected on the BGPVPN agent
+PORT_BGPVPN_ATTRIBUTES = ('status', 'binding:host_id', 'fixed_ips',
+                          'mac_address')
+
 
 def get_network_info_for_port(context, port_id):
     """Get MAC, IP and Gateway IP addresses informations for a specific port"""
@@ -60,13 +107,77 @@ def get_network_info_for_port(context, port_id):
         return
 
 
-def get_network_ports(context, network_id):
-    try:
-        return (context.session.query(models_v2.Port).
-                filter(models_v2.Port.network_id == network_id,
-                       models_v2.Port.admin_state_up == sql.true()).all())
-    except exc.NoResultFound:
-        return
+def get_host_ports_network_info(context, host):
+    """Get MAC, IP and Gateway IP addresses of the active ports of a host
+
+    DHCP ports are left out. The addresses of all the ports are read in a
+    single query, only the first fixed IP of a port being returned.
+    """
+    query = (context.session.
+             query(models_v2.Port.id,
+                   models_v2.Port.network_id,
+                   models_v2.Port.mac_address,
+                   models_v2.IPAllocation.ip_address,
+                   models_v2.Subnet.cidr,
+                   models_v2.Subnet.gateway_ip).
+             join(ml2_models.PortBinding,
+                  ml2_models.PortBinding.port_id == models_v2.Port.id).
+             join(models_v2.IPAllocation).
+             join(models_v2.Subnet,
+                  models_v2.IPAllocation.subnet_id == models_v2.Subnet.id).
+             filter(ml2_models.PortBinding.host == host,
+                    models_v2.Port.status == const.PORT_STATUS_ACTIVE,
+                    models_v2.Port.device_owner != const.DEVICE_OWNER_DHCP).
+             order_by(models_v2.Port.id))
+
+    port_infos = collections.OrderedDict()
+    for (port_id, network_id, mac_address, ip_address, cidr,
+         gateway_ip) in query:
+        if port_id in port_infos:
+            continue
+        port_infos[port_id] = {
+            'id': port_id,
+            'network_id': network_id,
+            'mac_address': mac_address,
+            'ip_address': ip_address + cidr[cidr.index('/'):],
+            'gateway_ip': gateway_ip}
+    return list(port_infos.values())
+
+
+def get_network_hosts(context, network_ids):
+    """Get the hosts having admin up ports on each of the given networks
+
+    Returns a dict mapping network ids to sets of hosts, networks without
+    any bound admin up port are left out.
+    """
+    if not network_ids:
+        return {}
+    query = (context.session.query(models_v2.Port.network_id,
+                                   ml2_models.PortBinding.host).
+             join(ml2_models.PortBinding,
+                  ml2_models.PortBinding.port_id == models_v2.Port.id).
+             filter(models_v2.Port.network_id.in_(network_ids),
+                    models_v2.Port.admin_state_up == sql.true(),
+                    ml2_models.PortBinding.host != '').
+             distinct())
+    network_hosts = {}
+    for network_id, host in query:
+        network_hosts.setdefault(network_id, set()).add(host)
+    return network_hosts
+
+
+def get_port_hosts(context, port_ids):
+    """Get the binding host of each of the given ports
+
+    The port binding table is read directly, in a single query, rather
+    than building the full port dicts through the core plugin.
+    """
+    if not port_ids:
+        return {}
+    query = (context.session.query(ml2_models.PortBinding.port_id,
+                                   ml2_models.PortBinding.host).
+             filter(ml2_models.PortBinding.port_id.in_(port_ids)))
+    return dict(query)
 
 
 class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriver):
@@ -76,7 +187,33 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriver):
     def __init__(self, service_plugin):
         super(BaGPipeBGPVPNDriver, self).__init__(service_plugin)
 
-        self.agent_rpc = rpc_client.BGPVPNAgentNotifyApi()
+        self.agent_rpc = rpc.BaGPipeBGPVPNAgentNotifyApi()
+
+        # network id -> (bgpvpn revisions, formatted route targets)
+        self._network_rts = cache.LRUCache(cfg.CONF.bagpipe_bgpvpn.cache_size)
+
+        # ids of the networks associated to a bgpvpn, or of the networks
+        # which were associated to one at the time of the last refresh
+        self._vpn_networks = set()
+        self._vpn_networks_refreshed_at = None
+
+        # (agent host, bgpvpn id, network id) -> hash of the last
+        # update_bgpvpn notification sent, and of the bgpvpn revision
+        duplicate_ttl = cfg.CONF.bagpipe_bgpvpn.duplicate_notification_ttl
+        self._sent_hashes = cache.LRUCache(
+            cfg.CONF.bagpipe_bgpvpn.cache_size if duplicate_ttl > 0 else 0,
+            ttl=duplicate_ttl)
+        self._notification_counts = {'sent': 0, 'suppressed': 0}
+
+        # agent host -> (flush timer, port id -> (rpc method, context, port))
+        self._pending_port_events = {}
+        self._pending_lock = threading.Lock()
+
+        self.conn = n_rpc.create_connection(new=True)
+        self.conn.create_consumer(rpc.TOPIC_BGPVPN_PLUGIN,
+                                  [rpc.BaGPipeBGPVPNRpcCallback(self)],
+                                  fanout=False)
+        self.conn.consume_in_threads()
 
         registry.subscribe(self.registry_port_updated, resources.PORT,
                            events.AFTER_UPDATE)
@@ -115,41 +252,69 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriver):
             }
         }
 
+        Route targets of all the given BGPVPNs of a same type are merged
+        into deduplicated and sorted lists.
         """
         bgpvpn_rts = {}
         for bgpvpn in bgpvpns:
             # Add necessary keys to BGP VPN route targets dictionary
-            if bgpvpn['type'] + 'vpn' not in bgpvpn_rts:
-                bgpvpn_rts.update(
-                    {bgpvpn['type'] + 'vpn': {'import_rt': [],
-                                              'export_rt': []}}
-                )
-
-            if 'route_targets' in bgpvpn:
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['import_rt'] += (
-                    bgpvpn['route_targets']
-                )
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['export_rt'] += (
-                    bgpvpn['route_targets']
-                )
-
-            if 'import_targets' in bgpvpn:
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['import_rt'] += (
-                    bgpvpn['import_targets']
-                )
-
-            if 'export_targets' in bgpvpn:
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['export_rt'] += (
-                    bgpvpn['export_targets']
-                )
-
-        # FIXME: Only returning l3vpn route targets. Must be modified to also
-        # return l2vpn ones in the future
-        if 'l2vpn' in bgpvpn_rts:
-            bgpvpn_rts.pop('l2vpn')
+            vpn_rts = bgpvpn_rts.setdefault(bgpvpn['type'] + 'vpn',
+                                            {'import_rt': set(),
+                                             'export_rt': set()})
+
+            vpn_rts['import_rt'].update(bgpvpn.get('route_targets') or ())
+            vpn_rts['export_rt'].update(bgpvpn.get('route_targets') or ())
+            vpn_rts['import_rt'].update(bgpvpn.get('import_targets') or ())
+            vpn_rts['export_rt'].update(bgpvpn.get('export_targets') or ())
+
+        # sorted lists, so that agents can compare them cheaply
+        for vpn_rts in bgpvpn_rts.values():
+            for direction, rts in vpn_rts.items():
+                vpn_rts[direction] = sorted(rts)
 
         return bgpvpn_rts
 
+    def _is_vpn_network(self, network_id):
+        """Check if a network is associated to a bgpvpn
+
+        The set of associated networks is refreshed from the database once
+        vpn_networks_refresh_interval expired, and in the meantime grows
+        with the associations made through this driver.
+        """
+        now = time.time()
+        if (self._vpn_networks_refreshed_at is None or
+                now - self._vpn_networks_refreshed_at >=
+                cfg.CONF.bagpipe_bgpvpn.vpn_networks_refresh_interval):
+            self._vpn_networks = self.bgpvpn_db.get_associated_network_ids(
+                n_context.get_admin_context())
+            self._vpn_networks_refreshed_at = now
+
+        return network_id in self._vpn_networks
+
+    def _get_network_route_targets(self, context, network_id):
+        """Get the aggregated route targets of the bgpvpns of a network
+
+        The formatted route targets of each network are kept along with the
+        revisions of the bgpvpns they were computed from, and are only
+        recomputed once an association or a bgpvpn changed.
+        Returns None if the network is not associated to any bgpvpn.
+        """
+        revisions = self.bgpvpn_db.get_bgpvpn_revisions_for_networks(
+            context, [network_id])[network_id]
+        if not revisions:
+            self._network_rts.invalidate(network_id)
+            return
+
+        cached = self._network_rts.get(
+            network_id, valid=lambda cached: cached[0] == revisions)
+        if cached is not None:
+            return copy.deepcopy(cached[1])
+
+        bgpvpns = self.bgpvpn_db.find_bgpvpns_for_network(context, network_id)
+        bgpvpn_rts = self._format_bgpvpn_network_route_targets(bgpvpns)
+        self._network_rts.set(network_id, (revisions, bgpvpn_rts))
+        return copy.deepcopy(bgpvpn_rts)
+
     def _retrieve_bgpvpn_network_info_for_port(self, context, port):
         """Retrieve BGP VPN network informations for a specific port
 
@@ -170,15 +335,11 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriver):
         bgpvpn_network_info = {}
 
         # Check if port is connected on a BGP VPN network
-        bgpvpns = (
-            self.bgpvpn_db.find_bgpvpns_for_network(context, network_id)
-        )
+        bgpvpn_rts = self._get_network_route_targets(context, network_id)
 
-        if not bgpvpns:
+        if bgpvpn_rts is None:
             return
 
-        bgpvpn_rts = self._format_bgpvpn_network_route_targets(bgpvpns)
-
         LOG.debug("Port connected on BGPVPN network %s with route targets "
                   "%s" % (network_id, bgpvpn_rts))
 
@@ -194,114 +355,273 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriver):
 
         return bgpvpn_network_info
 
-    def _get_bgpvpn_differences(self, current_dict, old_dict):
-        """Compare 2 BGPVPNs
+    def get_bgpvpn_port_infos_for_host(self, context, host):
+        """Get the BGPVPN network informations of the ports of a host
 
-        - added elements (route_targets, import_targets or export_targets)
-        - removed elements (route_targets, import_targets or export_targets)
-        - changed values for keys in both dictionaries  (network_id,
-          route_targets, import_targets or export_targets)
+        Returns, for all the active ports of the host which are on a
+        network associated to a BGPVPN, the port informations that
+        attach_port_on_bgpvpn notifications carry, so that an agent can
+        resync in one call.
         """
-        set_current = set(current_dict.keys())
-        set_old = set(old_dict.keys())
-        intersect = set_current.intersection(set_old)
-
-        added = set_current - intersect
-        removed = set_old - intersect
-        changed = set(
-            key for key in intersect if old_dict[key] != current_dict[key]
-        )
+        port_infos = get_host_ports_network_info(context, host)
+        bgpvpns_for_net = self.bgpvpn_db.find_bgpvpns_for_networks(
+            context, set(info['network_id'] for info in port_infos))
+
+        network_rts = {}
+        bgpvpn_port_infos = []
+        for port_info in port_infos:
+            network_id = port_info['network_id']
+            if not bgpvpns_for_net[network_id]:
+                continue
+            if network_id not in network_rts:
+                network_rts[network_id] = (
+                    self._format_bgpvpn_network_route_targets(
+                        bgpvpns_for_net[network_id]))
+            port_info.update(copy.deepcopy(network_rts[network_id]))
+            bgpvpn_port_infos.append(port_info)
+
+        LOG.debug("Found %d ports on BGPVPN networks on host %s",
+                  len(bgpvpn_port_infos), host)
+        return bgpvpn_port_infos
+
+    def _get_route_target_changes(self, old_bgpvpn, bgpvpn):
+        """Compare the route targets of 2 versions of a BGPVPN
+
+        Returns, for each VPN type and import/export direction whose route
+        targets differ, the sets of added and removed route targets:
 
-        return (added, removed, changed)
+        {
+            'l3vpn': {
+                'import_rt': (set(['12345:3']), set(['12345:1']))
+            }
+        }
+        """
+        old_rts = self._format_bgpvpn_network_route_targets([old_bgpvpn])
+        new_rts = self._format_bgpvpn_network_route_targets([bgpvpn])
+
+        changes = {}
+        for vpn_type in set(old_rts) | set(new_rts):
+            for direction in ('import_rt', 'export_rt'):
+                old = set(old_rts.get(vpn_type, {}).get(direction, ()))
+                new = set(new_rts.get(vpn_type, {}).get(direction, ()))
+                if old != new:
+                    changes.setdefault(vpn_type, {})[direction] = (
+                        new - old, old - new)
+        return changes
 
     def delete_bgpvpn_postcommit(self, context, bgpvpn):
+        network_hosts = get_network_hosts(context, bgpvpn['networks'])
         for net_id in bgpvpn['networks']:
-            if get_network_ports(context, net_id):
+            for host in network_hosts.get(net_id, ()):
                 # Format BGPVPN before sending notification
-                self.agent_rpc.delete_bgpvpn(
-                    context,
-                    self._format_bgpvpn(bgpvpn, net_id))
+                self._cast_bgpvpn(context, 'delete_bgpvpn',
+                                  self._format_bgpvpn(bgpvpn, net_id), host)
 
     def associate_network_postcommit(self, context, bgpvpn_id, network_id):
-        if get_network_ports(context,
-                             network_id):
-            bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
-            formated_bgpvpn = self._format_bgpvpn(bgpvpn, network_id)
-            self.agent_rpc.update_bgpvpn(
-                context,
-                formated_bgpvpn)
+        self.associate_networks_postcommit(context, bgpvpn_id, [network_id])
+
+    def associate_networks_postcommit(self, context, bgpvpn_id, network_ids):
+        self._vpn_networks.update(network_ids)
+        bgpvpn = None
+        network_hosts = get_network_hosts(context, network_ids)
+        for network_id in network_ids:
+            for host in network_hosts.get(network_id, ()):
+                if bgpvpn is None:
+                    bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+                    revision = self.bgpvpn_db.get_bgpvpn_revision(
+                        context, bgpvpn_id)
+                formated_bgpvpn = self._format_bgpvpn(bgpvpn, network_id)
+                self._cast_bgpvpn(context, 'update_bgpvpn',
+                                  formated_bgpvpn, host, revision)
 
     def disassociate_network_postcommit(self, context, bgpvpn_id, network_id):
-        if get_network_ports(context,
-                             network_id):
-            LOG.debug("bagpipe disassoc")
-            bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
-            formated_bgpvpn = self._format_bgpvpn(bgpvpn, network_id)
-            self.agent_rpc.delete_bgpvpn(context, formated_bgpvpn)
+        self.disassociate_networks_postcommit(context, bgpvpn_id,
+                                              [network_id])
+
+    def disassociate_networks_postcommit(self, context, bgpvpn_id,
+                                         network_ids):
+        bgpvpn = None
+        network_hosts = get_network_hosts(context, network_ids)
+        for network_id in network_ids:
+            for host in network_hosts.get(network_id, ()):
+                LOG.debug("bagpipe disassoc")
+                bgpvpn = bgpvpn or self.get_bgpvpn(context, bgpvpn_id)
+                formated_bgpvpn = self._format_bgpvpn(bgpvpn, network_id)
+                self._cast_bgpvpn(context, 'delete_bgpvpn',
+                                  formated_bgpvpn, host)
 
     def update_bgpvpn_postcommit(self, context, old_bgpvpn, bgpvpn):
-        (added_keys, removed_keys, changed_keys) = (
-            self._get_bgpvpn_differences(bgpvpn, old_bgpvpn))
+        changes = self._get_route_target_changes(old_bgpvpn, bgpvpn)
+        if not changes:
+            LOG.debug("No route target change on BGPVPN %s, not notifying "
+                      "agents", bgpvpn['id'])
+            return
+
+        LOG.debug("Route target changes on BGPVPN %s (added, removed): %s",
+                  bgpvpn['id'], changes)
+        revision = self.bgpvpn_db.get_bgpvpn_revision(context, bgpvpn['id'])
+        network_hosts = get_network_hosts(context, bgpvpn['networks'])
         for net_id in bgpvpn['networks']:
-            if (get_network_ports(context, net_id)):
-                if ((key in added_keys for key in ('route_targets',
-                                                   'import_targets',
-                                                   'export_targets')) or
-                    (key in removed_keys for key in ('route_targets',
-                                                     'import_targets',
-                                                     'export_targets')) or
-                    (key in changed_keys for key in ('route_targets',
-                                                     'import_targets',
-                                                     'export_targets'))):
-                    self.agent_rpc.update_bgpvpn(
-                        context,
-                        self._format_bgpvpn(bgpvpn, net_id)
-                    )
-
-    def _get_port_host(self, port_id):
-        # the port dict, as provided by the registry callback
-        # has no binding:host_id information, it seems the reason is
-        # because the context is not admin
-        # let's switch to an admin context and retrieve full port info
-        _core_plugin = manager.NeutronManager.get_plugin()
-        full_port = _core_plugin.get_port(n_context.get_admin_context(),
-                                          port_id)
-
-        if 'binding:host_id' not in full_port:
+            for host in network_hosts.get(net_id, ()):
+                self._cast_bgpvpn(context, 'update_bgpvpn',
+                                  self._format_bgpvpn(bgpvpn, net_id), host,
+                                  revision)
+
+    def _get_port_host(self, port):
+        # the port dict, as provided by the registry callback, may have no
+        # binding:host_id information, when the context is not admin
+        # let's then read the port binding with an admin context
+        host = port.get('binding:host_id')
+        if not host:
+            host = get_port_hosts(n_context.get_admin_context(),
+                                  [port['id']]).get(port['id'])
+
+        if host is None:
             raise Exception("cannot determine host_id for port %s, "
-                            "aborting BGPVPN update", port_id)
+                            "aborting BGPVPN update", port['id'])
+
+        return host
 
-        return full_port.get('binding:host_id')
+    def _cast_bgpvpn(self, context, method, formatted_bgpvpn, host,
+                     revision=None):
+        """Send a BGPVPN notification to the agent of a host
+
+        An update_bgpvpn notification identical to the last one sent to the
+        same host, for the same revision of the BGPVPN, is not sent again.
+        The revision tells apart a duplicate callback from a BGPVPN changed
+        back to a previous state by another neutron-server worker, whose
+        notifications this worker does not know about. delete_bgpvpn
+        notifications are always sent and forget the last update.
+        """
+        cache_key = (host, formatted_bgpvpn['id'],
+                     formatted_bgpvpn['network_id'])
+        if method == 'update_bgpvpn':
+            digest = hashlib.sha1(
+                json.dumps([revision, formatted_bgpvpn],
+                           sort_keys=True).encode('utf-8')
+            ).hexdigest()
+            if self._sent_hashes.get(cache_key) == digest:
+                LOG.debug("Not sending %s to host %s, unchanged since the "
+                          "last one", method, host)
+                self._notification_counts['suppressed'] += 1
+                return
+            getattr(self.agent_rpc, method)(context, formatted_bgpvpn, host)
+            self._sent_hashes.set(cache_key, digest)
+        else:
+            getattr(self.agent_rpc, method)(context, formatted_bgpvpn, host)
+            self._sent_hashes.invalidate(cache_key)
+        self._notification_counts['sent'] += 1
+
+    def _cast_port(self, context, method, port_bgpvpn_info, host):
+        # port notifications are never suppressed: the previous one may
+        # have been superseded by a notification sent by another
+        # neutron-server worker, registry_port_updated already ignores the
+        # port updates which are not BGPVPN related
+        getattr(self.agent_rpc, method)(context, port_bgpvpn_info, host)
+        self._notification_counts['sent'] += 1
+
+    def notification_stats(self):
+        """Return the numbers of agent notifications sent and suppressed"""
+        return dict(self._notification_counts)
+
+    def _send_port_event(self, context, method, port, agent_host,
+                         db_context=None):
+        """Build the BGPVPN information of a port and notify the agent
+
+        For an attach, the route targets are read at the time the
+        notification is sent, the port is not attached if its network is
+        no longer associated to any BGPVPN.
+        """
+        port_bgpvpn_info = {'id': port['id'],
+                            'network_id': port['network_id']}
+
+        if method == 'attach_port_on_bgpvpn':
+            bgpvpn_network_info = (
+                self._retrieve_bgpvpn_network_info_for_port(
+                    db_context or context, port)
+            )
+            if not bgpvpn_network_info:
+                LOG.debug("Port %s is no longer on a BGPVPN network, not "
+                          "attaching it", port['id'])
+                return
+            port_bgpvpn_info.update(bgpvpn_network_info)
+
+        self._cast_port(context, method, port_bgpvpn_info, agent_host)
+
+    def _notify_port(self, context, method, port, agent_host):
+        window = cfg.CONF.bagpipe_bgpvpn.port_notification_window
+        if window <= 0:
+            self._send_port_event(context, method, port, agent_host)
+            return
+
+        with self._pending_lock:
+            if agent_host in self._pending_port_events:
+                pending = self._pending_port_events[agent_host][1]
+            else:
+                pending = collections.OrderedDict()
+                timer = eventlet.spawn_after(window, self._flush_port_events,
+                                             agent_host)
+                self._pending_port_events[agent_host] = (timer, pending)
+            # the last event on a port supersedes a pending one, an attach
+            # followed by a detach only results in the detach
+            pending.pop(port['id'], None)
+            pending[port['id']] = (method, context, port)
+            full = (len(pending) >=
+                    cfg.CONF.bagpipe_bgpvpn.port_notification_batch_size)
+
+        if full:
+            self._flush_port_events(agent_host)
+
+    def _flush_port_events(self, agent_host):
+        with self._pending_lock:
+            timer, pending = self._pending_port_events.pop(agent_host,
+                                                           (None, None))
+        if not pending:
+            return
+        # when flushed because the buffer is full, the timer must not
+        # flush the next buffer of the host early; cancel() has no effect
+        # when the timer is the one running this flush
+        timer.cancel()
+
+        LOG.debug("Sending %d buffered port notifications to host %s",
+                  len(pending), agent_host)
+        # the BGPVPN information is read now rather than when the event was
+        # buffered, so that a BGPVPN update or delete notification sent
+        # to the host in the meantime is not undone by a stale attach
+        db_context = n_context.get_admin_context()
+        for method, context, port in pending.values():
+            try:
+                self._send_port_event(context, method, port, agent_host,
+                                      db_context)
+            except Exception:
+                LOG.exception(_LE("Failed to send %(method)s for port "
+                                  "%(port)s to host %(host)s"),
+                              {'method': method,
+                               'port': port['id'],
+                               'host': agent_host})
 
     def notify_port_updated(self, context, port):
         LOG.info("notify_port_updated on port %s status %s",
                  port['id'],
                  port['status'])
 
-        port_bgpvpn_info = {'id': port['id'],
-                            'network_id': port['network_id']}
-
         if port['device_owner'] == const.DEVICE_OWNER_DHCP:
             LOG.info("Port %s is DHCP, ignoring", port['id'])
             return
 
-        agent_host = self._get_port_host(port['id'])
-
-        if port['status'] == const.PORT_STATUS_ACTIVE:
-            bgpvpn_network_info = (
-                self._retrieve_bgpvpn_network_info_for_port(context, port)
-            )
+        if not self._is_vpn_network(port['network_id']):
+            LOG.debug("Port %s is not on a BGPVPN network, ignoring",
+                      port['id'])
+            return
 
-            if bgpvpn_network_info:
-                port_bgpvpn_info.update(bgpvpn_network_info)
+        agent_host = self._get_port_host(port)
 
-                self.agent_rpc.attach_port_on_bgpvpn(context,
-                                                     port_bgpvpn_info,
-                                                     agent_host)
+        if port['status'] == const.PORT_STATUS_ACTIVE:
+            self._notify_port(context, 'attach_port_on_bgpvpn', port,
+                              agent_host)
         elif port['status'] == const.PORT_STATUS_DOWN:
-            self.agent_rpc.detach_port_from_bgpvpn(context,
-                                                   port_bgpvpn_info,
-                                                   agent_host)
+            self._notify_port(context, 'detach_port_from_bgpvpn', port,
+                              agent_host)
         else:
             LOG.info("no action since new port status is %s", port['status'])
 
@@ -311,22 +631,30 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriver):
                  port['id'],
                  port['status'])
 
-        port_bgpvpn_info = {'id': port['id'],
-                            'network_id': port['network_id']}
-
         if port['device_owner'] == const.DEVICE_OWNER_DHCP:
             LOG.info("Port %s is DHCP, ignoring", port['id'])
             return
 
-        agent_host = self._get_port_host(port['id'])
+        if not self._is_vpn_network(port['network_id']):
+            LOG.debug("Port %s is not on a BGPVPN network, ignoring",
+                      port['id'])
+            return
+
+        agent_host = self._get_port_host(port)
 
-        self.agent_rpc.detach_port_from_bgpvpn(context,
-                                               port_bgpvpn_info,
-                                               agent_host)
+        self._notify_port(context, 'detach_port_from_bgpvpn', port,
+                          agent_host)
 
     def registry_port_updated(self, resource, event, trigger, **kwargs):
         context = kwargs.get('context')
         port_dict = kwargs.get('port')
+        original_port = kwargs.get('original_port')
+        if original_port and not any(
+                original_port.get(attr) != port_dict.get(attr)
+                for attr in PORT_BGPVPN_ATTRIBUTES):
+            LOG.debug("No BGPVPN related change on port %s, ignoring",
+                      port_dict['id'])
+            return
         self.notify_port_updated(context, port_dict)
 
     def registry_port_deleted(self, resource, event, trigger, **kwargs):
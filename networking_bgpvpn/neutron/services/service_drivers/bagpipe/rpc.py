@@ -0,0 +1,94 @@
+# Copyright (c) 2015 Orange.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import oslo_messaging
+from oslo_log import log as logging
+
+from neutron.common import rpc as n_rpc
+
+from networking_bagpipe_l2.agent.bgpvpn import rpc_client
+
+LOG = logging.getLogger(__name__)
+
+TOPIC_BGPVPN_PLUGIN = 'bagpipe-bgpvpn-plugin'
+
+
+class BaGPipeBGPVPNAgentNotifyApi(rpc_client.BGPVPNAgentNotifyApi):
+    """BGPVPN notifications to the bagpipe agents
+
+    BGPVPN update and delete notifications can be sent to the agent of a
+    single host, on the topic it consumes port notifications from, rather
+    than fanned out to all the agents.
+    """
+
+    def _notification_bgpvpn_host(self, context, method, bgpvpn, host):
+        LOG.debug("Notify BGP VPN agent %(host)s at %(topic)s the message "
+                  "%(method)s with %(bgpvpn)s",
+                  {'host': host,
+                   'topic': self.topic_bgpvpn_update,
+                   'method': method,
+                   'bgpvpn': bgpvpn})
+
+        cctxt = self.client.prepare(topic=self.topic_bgpvpn_update,
+                                    server=host)
+        cctxt.cast(context, method, bgpvpn=bgpvpn)
+
+    def update_bgpvpn(self, context, bgpvpn, host=None):
+        if not host:
+            return super(BaGPipeBGPVPNAgentNotifyApi, self).update_bgpvpn(
+                context, bgpvpn)
+        self._notification_bgpvpn_host(context, 'update_bgpvpn', bgpvpn,
+                                       host)
+
+    def delete_bgpvpn(self, context, bgpvpn, host=None):
+        if not host:
+            return super(BaGPipeBGPVPNAgentNotifyApi, self).delete_bgpvpn(
+                context, bgpvpn)
+        self._notification_bgpvpn_host(context, 'delete_bgpvpn', bgpvpn,
+                                       host)
+
+
+class BaGPipeBGPVPNRpcCallback(object):
+    """Server side of the RPCs of the bagpipe agents to the BGPVPN plugin
+
+    API version history:
+        1.0 - Initial version, with get_bgpvpn_port_infos
+    """
+
+    target = oslo_messaging.Target(version='1.0')
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def get_bgpvpn_port_infos(self, context, host):
+        """Get the BGPVPN information of all the active ports of a host"""
+        return self.driver.get_bgpvpn_port_infos_for_host(context, host)
+
+
+class BaGPipeBGPVPNPluginApi(object):
+    """Client side of the RPCs of the bagpipe agents to the BGPVPN plugin"""
+
+    def __init__(self, topic=TOPIC_BGPVPN_PLUGIN):
+        target = oslo_messaging.Target(topic=topic, version='1.0')
+        self.client = n_rpc.get_client(target)
+
+    def get_bgpvpn_port_infos(self, context, host):
+        """Get, in one call, what attach_port_on_bgpvpn would have sent
+
+        Returns the list of the port BGPVPN information of all the active
+        ports of the host which are on a network associated to a BGPVPN.
+        """
+        cctxt = self.client.prepare()
+        return cctxt.call(context, 'get_bgpvpn_port_infos', host=host)
@@ -17,6 +17,7 @@ import abc
 import six
 
 from networking_bgpvpn.neutron.db import bgpvpn_db
+from networking_bgpvpn.neutron.services.common import constants
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -27,6 +28,11 @@ class BGPVPNDriverBase(object):
     driver need to do it by itself.
     """
 
+    # whether get_bgpvpns supports the sorts, and limit, marker and
+    # page_reverse arguments
+    native_sorting_support = False
+    native_pagination_support = False
+
     def __init__(self, service_plugin):
         self.service_plugin = service_plugin
 
@@ -58,6 +64,22 @@ class BGPVPNDriverBase(object):
     def associate_network(self, context, id, network_id):
         pass
 
+    def associate_networks(self, context, id, network_ids):
+        for network_id in network_ids:
+            self.associate_network(context, id, network_id)
+
+    def disassociate_networks(self, context, id, network_ids):
+        for network_id in network_ids:
+            self.disassociate_network(context, id, network_id)
+
+    def create_bgpvpn_bulk(self, context, bgpvpns):
+        return [self.create_bgpvpn(context, bgpvpn)
+                for bgpvpn in bgpvpns[constants.BGPVPN_RES]]
+
+    def delete_bgpvpn_bulk(self, context, ids):
+        for id in ids:
+            self.delete_bgpvpn(context, id)
+
     @abc.abstractmethod
     def disassociate_network(self, context, id, network_id):
         pass
@@ -71,6 +93,9 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase):
     the result to postcommit methods
     """
 
+    native_sorting_support = True
+    native_pagination_support = True
+
     def __init__(self, service_plugin):
         super(BGPVPNDriverDBMixin, self).__init__(service_plugin)
         self.bgpvpn_db = bgpvpn_db.BGPVPNPluginDb()
@@ -81,8 +106,18 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase):
         self.create_bgpvpn_postcommit(context, bgpvpn)
         return bgpvpn
 
-    def get_bgpvpns(self, context, filters=None, fields=None):
-        return self.bgpvpn_db.get_bgpvpns(context, filters, fields)
+    def create_bgpvpn_bulk(self, context, bgpvpns):
+        bgpvpns = self.bgpvpn_db.create_bgpvpns(
+            context, bgpvpns[constants.BGPVPN_RES])
+        self.create_bgpvpn_bulk_postcommit(context, bgpvpns)
+        return bgpvpns
+
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
+        return self.bgpvpn_db.get_bgpvpns(context, filters, fields,
+                                          sorts=sorts, limit=limit,
+                                          marker=marker,
+                                          page_reverse=page_reverse)
 
     def get_bgpvpn(self, context, id, fields=None):
         return self.bgpvpn_db.get_bgpvpn(context, id, fields)
@@ -100,6 +135,10 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase):
         bgpvpn = self.bgpvpn_db.delete_bgpvpn(context, id)
         self.delete_bgpvpn_postcommit(context, bgpvpn)
 
+    def delete_bgpvpn_bulk(self, context, ids):
+        bgpvpns = self.bgpvpn_db.delete_bgpvpns(context, ids)
+        self.delete_bgpvpn_bulk_postcommit(context, bgpvpns)
+
     def associate_network(self, context, id, network_id):
         self.bgpvpn_db.associate_network(context, id, network_id)
         self.associate_network_postcommit(context, id, network_id)
@@ -108,6 +147,14 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase):
         self.bgpvpn_db.disassociate_network(context, id, network_id)
         self.disassociate_network_postcommit(context, id, network_id)
 
+    def associate_networks(self, context, id, network_ids):
+        self.bgpvpn_db.associate_networks(context, id, network_ids)
+        self.associate_networks_postcommit(context, id, network_ids)
+
+    def disassociate_networks(self, context, id, network_ids):
+        self.bgpvpn_db.disassociate_networks(context, id, network_ids)
+        self.disassociate_networks_postcommit(context, id, network_ids)
+
     @abc.abstractmethod
     def create_bgpvpn_postcommit(self, context, bgpvpn):
         pass
@@ -120,6 +167,24 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase):
     def delete_bgpvpn_postcommit(self, context, bgpvpn):
         pass
 
+    def create_bgpvpn_bulk_postcommit(self, context, bgpvpns):
+        """Postcommit of a bulk creation
+
+        Drivers able to batch their backend calls can override it, it
+        defaults to one create_bgpvpn_postcommit call per bgpvpn.
+        """
+        for bgpvpn in bgpvpns:
+            self.create_bgpvpn_postcommit(context, bgpvpn)
+
+    def delete_bgpvpn_bulk_postcommit(self, context, bgpvpns):
+        """Postcommit of a bulk deletion
+
+        Drivers able to batch their backend calls can override it, it
+        defaults to one delete_bgpvpn_postcommit call per bgpvpn.
+        """
+        for bgpvpn in bgpvpns:
+            self.delete_bgpvpn_postcommit(context, bgpvpn)
+
     @abc.abstractmethod
     def associate_network_postcommit(self, context, bgpvpn_id, network_id):
         pass
@@ -128,6 +193,26 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase):
     def disassociate_network_postcommit(self, context, bgpvpn_id, network_id):
         pass
 
+    def associate_networks_postcommit(self, context, bgpvpn_id, network_ids):
+        """Postcommit of the association of several networks
+
+        Drivers able to batch their backend calls can override it, it
+        defaults to one associate_network_postcommit call per network.
+        """
+        for network_id in network_ids:
+            self.associate_network_postcommit(context, bgpvpn_id, network_id)
+
+    def disassociate_networks_postcommit(self, context, bgpvpn_id,
+                                         network_ids):
+        """Postcommit of the disassociation of several networks
+
+        Drivers able to batch their backend calls can override it, it
+        defaults to one disassociate_network_postcommit call per network.
+        """
+        for network_id in network_ids:
+            self.disassociate_network_postcommit(context, bgpvpn_id,
+                                                 network_id)
+
 
 class BGPVPNDriver(BGPVPNDriverDBMixin):
     """BGPVPNDriver interface for driver with database.
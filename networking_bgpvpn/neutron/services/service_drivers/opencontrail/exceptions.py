@@ -59,3 +59,8 @@ class OpenContrailAPIConflict(n_exc.Conflict):
 class OpenContrailAPIBadRequest(n_exc.BadRequest):
     message = _("OpenContrail API bad request: %(reason)s")
     pass
+
+
+class OpenContrailBGPVPNAssociationFailed(n_exc.NeutronException):
+    message = _("Failed to %(operation)s route targets of BGPVPN %(id)s: "
+                "%(errors)s")
@@ -18,15 +18,24 @@
 # - Can we have the same rt use by different bgpvpn connections?
 # - Can we have different bgpvpn connections associated to the same net/router?
 
+from neutron.i18n import _
+from neutron.i18n import _LE
+from neutron.i18n import _LI
 from neutron.i18n import _LW
+from oslo_concurrency import lockutils
+from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import uuidutils
 
+import copy
+import eventlet
 import json
+import six
 
 from neutron.common import exceptions as n_exc
 
 from networking_bgpvpn.neutron.extensions import bgpvpn as bgpvpn_ext
+from networking_bgpvpn.neutron.services.common import cache
 from networking_bgpvpn.neutron.services.common import constants
 from networking_bgpvpn.neutron.services.common import utils
 from networking_bgpvpn.neutron.services.service_drivers import driver_api
@@ -37,8 +46,29 @@ from networking_bgpvpn.neutron.services.service_drivers.opencontrail import \
 
 OPENCONTRAIL_BGPVPN_DRIVER_NAME = 'OpenContrail'
 
+# Key/value store keys of the lists of the ids of all the BGPVPNs and of
+# the BGPVPNs of a tenant
+BGPVPN_INDEX_KEY = 'bgpvpn-index'
+TENANT_BGPVPN_INDEX_KEY = 'bgpvpn-index-%s'
+KV_INDEX_LOCK = 'opencontrail-bgpvpn-kv-index'
+
 LOG = log.getLogger(__name__)
 
+opencontrail_bgpvpn_opts = [
+    cfg.IntOpt('cache_size', default=10000,
+               help=_('Maximum number of entries of each of the caches of '
+                      'OpenContrail identifiers of the OpenContrail BGPVPN '
+                      'driver.')),
+    cfg.IntOpt('cache_ttl', default=300,
+               help=_('Number of seconds after which a cached OpenContrail '
+                      'identifier is looked up again.')),
+    cfg.IntOpt('api_concurrency', default=10,
+               help=_('Maximum number of concurrent requests to the '
+                      'OpenContrail API server when updating the route '
+                      'targets of the networks of a BGPVPN.')),
+]
+cfg.CONF.register_opts(opencontrail_bgpvpn_opts, 'opencontrail_bgpvpn')
+
 
 class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
     """BGP VPN Service Driver class for OpenContrail."""
@@ -48,6 +78,15 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
         LOG.debug("OpenContrailBGPVPNDriver service_plugin : %s",
                   service_plugin)
 
+        # route target fq_name -> uuid
+        self._rt_uuids = cache.LRUCache(
+            cfg.CONF.opencontrail_bgpvpn.cache_size,
+            ttl=cfg.CONF.opencontrail_bgpvpn.cache_ttl)
+        # network id -> primary routing instance uuid
+        self._network_ris = cache.LRUCache(
+            cfg.CONF.opencontrail_bgpvpn.cache_size,
+            ttl=cfg.CONF.opencontrail_bgpvpn.cache_ttl)
+
     def _get_opencontrail_api_client(self, context):
         return opencontrail_client.OpenContrailAPIBaseClient(
             tenant=context.tenant,
@@ -65,6 +104,10 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
         return tenant_id
 
     def _locate_rt(self, oc_client, rt_fq_name):
+        rt_uuid = self._rt_uuids.get(tuple(rt_fq_name))
+        if rt_uuid:
+            return rt_uuid
+
         try:
             rt_uuid = oc_client.fqname_to_id('route-target', rt_fq_name)
         except oc_exc.OpenContrailAPINotFound:
@@ -75,6 +118,7 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
             }
             rt_uuid = oc_client.create('Route Target', body)['uuid']
 
+        self._rt_uuids.set(tuple(rt_fq_name), rt_uuid)
         return rt_uuid
 
     def _update_rt_ri_association(self, oc_client, operation, ri_id,
@@ -92,55 +136,270 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
                 "import_export": import_export
             }
         }
-        oc_client.ref_update(**kwargs)
+        try:
+            oc_client.ref_update(**kwargs)
+        except oc_exc.OpenContrailAPINotFound:
+            # the error does not tell if the routing instance or the route
+            # target is missing, a missing routing instance is left to the
+            # caller
+            if self._rt_exists(oc_client, rt_uuid):
+                raise
+            # the cached route target was deleted by another server, look
+            # it up again
+            self._rt_uuids.invalidate(tuple(rt_fq_name))
+            kwargs['ref_uuid'] = rt_uuid = self._locate_rt(oc_client,
+                                                           rt_fq_name)
+            oc_client.ref_update(**kwargs)
 
-        if operation == 'ADD':
-            return rt_uuid
+        return rt_uuid
 
+    def _rt_exists(self, oc_client, rt_uuid):
+        try:
+            oc_client.show('Route Target', rt_uuid)
+        except oc_exc.OpenContrailAPINotFound:
+            return False
+        return True
+
+    def _delete_unused_rt(self, oc_client, rt_fq_name):
+        rt_uuid = self._locate_rt(oc_client, rt_fq_name)
         rt = oc_client.show('Route Target', rt_uuid)
         if 'routing_instance_back_refs' not in rt.keys():
-            rt = oc_client.remove('Route Target', rt_uuid)
-        else:
-            return rt_uuid
+            self._rt_uuids.invalidate(tuple(rt_fq_name))
+            oc_client.remove('Route Target', rt_uuid)
 
     def _get_ri_id_of_network(self, oc_client, network_id):
+        ri_id = self._network_ris.get(network_id)
+        if ri_id:
+            return ri_id
+
         try:
-            network = oc_client.show('Virtual Network', network_id)
+            # only the routing instances are needed, the API server always
+            # returns the fq_name
+            network = oc_client.show('Virtual Network', network_id,
+                                     fields='routing_instances')
             ri_fq_name = network['fq_name'] + [network['fq_name'][-1]]
             for ri_ref in network.get('routing_instances', []):
                 if ri_ref['to'] == ri_fq_name:
+                    self._network_ris.set(network_id, ri_ref['uuid'])
                     return ri_ref['uuid']
         except (oc_exc.OpenContrailAPINotFound, IndexError):
+            self._network_ris.invalidate(network_id)
             raise n_exc.NetworkNotFound(net_id=network_id)
 
+    def _get_rt_fq_names(self, bgpvpn):
+        """Get the (fq_name, import_export) of the route targets of a BGPVPN
+        """
+        if bgpvpn['type'] != constants.BGPVPN_L3:
+            return []
+
+        rts = []
+        for rt in bgpvpn['route_targets']:
+            rts.append((['target'] + rt.split(':'), None))
+        for rt in bgpvpn['import_targets']:
+            rts.append((['target'] + rt.split(':'), "import"))
+        for rt in bgpvpn['export_targets']:
+            rts.append((['target'] + rt.split(':'), "export"))
+        return rts
+
+    def _set_network_association(self, oc_client, operation, rts,
+                                 network_id):
+        net_ri_id = self._get_ri_id_of_network(oc_client, network_id)
+        for rt_fq_name, import_export in rts:
+            self._update_rt_ri_association(oc_client, operation, net_ri_id,
+                                           rt_fq_name,
+                                           import_export=import_export)
+
+    def _set_network_association_with_retry(self, oc_client, operation, rts,
+                                            network_id):
+        try:
+            self._set_network_association(oc_client, operation, rts,
+                                          network_id)
+        except oc_exc.OpenContrailAPINotFound:
+            # the cached routing instance of the network may be gone,
+            # with the network, look it up again
+            LOG.debug("Routing instance of network %s not found, "
+                      "retrying", network_id)
+            self._network_ris.invalidate(network_id)
+            self._set_network_association(oc_client, operation, rts,
+                                          network_id)
+
     def _set_bgpvpn_association(self, oc_client, operation, bgpvpn,
-                                network_id=None):
-        if network_id:
-            networks = [network_id]
+                                network_ids=None):
+        if network_ids is not None:
+            networks = network_ids
         else:
             networks = bgpvpn.get('networks', [])
+        rts = self._get_rt_fq_names(bgpvpn)
+        if not networks or not rts:
+            return bgpvpn
+
+        # locate, and create if needed, route targets once before the
+        # concurrent ref updates, which then find them in the cache
+        for rt_fq_name, _import_export in rts:
+            self._locate_rt(oc_client, rt_fq_name)
+
+        # the ref updates of the different networks are independent, each
+        # green thread uses its own copy of the client, which holds the
+        # state of the request in progress but shares the HTTP session
+        errors = []
+
+        def set_network_association(network_id):
+            try:
+                self._set_network_association_with_retry(
+                    copy.copy(oc_client), operation, rts, network_id)
+            except Exception as e:
+                errors.append((network_id, e))
+
+        pool = eventlet.GreenPool(
+            cfg.CONF.opencontrail_bgpvpn.api_concurrency)
         for network_id in networks:
-            net_ri_id = self._get_ri_id_of_network(oc_client, network_id)
-            if bgpvpn['type'] == constants.BGPVPN_L3:
-                for rt in bgpvpn['route_targets']:
-                    rt_fq_name = ['target'] + rt.split(':')
-                    self._update_rt_ri_association(oc_client, operation,
-                                                   net_ri_id, rt_fq_name)
-
-                for rt in bgpvpn['import_targets']:
-                    rt_fq_name = ['target'] + rt.split(':')
-                    self._update_rt_ri_association(oc_client, operation,
-                                                   net_ri_id, rt_fq_name,
-                                                   import_export="import")
-
-                for rt in bgpvpn['export_targets']:
-                    rt_fq_name = ['target'] + rt.split(':')
-                    self._update_rt_ri_association(oc_client, operation,
-                                                   net_ri_id, rt_fq_name,
-                                                   import_export="export")
+            pool.spawn_n(set_network_association, network_id)
+        pool.waitall()
+
+        if operation == 'DELETE':
+            for rt_fq_name in set(tuple(rt) for rt, _ie in rts):
+                try:
+                    self._delete_unused_rt(oc_client, list(rt_fq_name))
+                except Exception as e:
+                    errors.append((None, e))
+
+        if len(errors) == 1:
+            raise errors[0][1]
+        elif errors:
+            for network_id, e in errors:
+                LOG.error(_LE("Failed to %(operation)s route targets of "
+                              "BGPVPN %(bgpvpn)s for network %(network)s: "
+                              "%(error)s"),
+                          {'operation': operation, 'bgpvpn': bgpvpn['id'],
+                           'network': network_id, 'error': e})
+            raise oc_exc.OpenContrailBGPVPNAssociationFailed(
+                operation=operation, id=bgpvpn['id'],
+                errors='; '.join(six.text_type(e) for _n, e in errors))
 
         return bgpvpn
 
+    def _get_kv_index(self, oc_client, key):
+        try:
+            index = json.loads(oc_client.kv_store('RETRIEVE', key=key))
+        except (oc_exc.OpenContrailAPINotFound, ValueError):
+            return
+        if isinstance(index, dict) and 'bgpvpn_ids' in index:
+            return index['bgpvpn_ids']
+
+    def _store_kv_index(self, oc_client, key, bgpvpn_ids):
+        oc_client.kv_store('STORE', key=key,
+                           value={'bgpvpn_ids': bgpvpn_ids})
+
+    def _scan_kv_store(self, oc_client):
+        """Get all the BGPVPNs and indexes with a scan of the whole store
+
+        Returns the list of the BGPVPNs and a dict of the BGPVPN ids of
+        each of the indexes.
+        """
+        bgpvpns = []
+        indexes = {}
+        for kv_dict in oc_client.kv_store('RETRIEVE'):
+            try:
+                value = json.loads(kv_dict['value'])
+            except ValueError:
+                continue
+            if not isinstance(value, dict):
+                continue
+            if 'bgpvpn' in value:
+                bgpvpns.append(value['bgpvpn'])
+            elif ('bgpvpn_ids' in value and
+                    kv_dict['key'].startswith(BGPVPN_INDEX_KEY)):
+                indexes[kv_dict['key']] = value['bgpvpn_ids']
+        return bgpvpns, indexes
+
+    def _make_kv_indexes(self, bgpvpns):
+        indexes = {BGPVPN_INDEX_KEY: []}
+        for bgpvpn in bgpvpns:
+            indexes[BGPVPN_INDEX_KEY].append(bgpvpn['id'])
+            indexes.setdefault(TENANT_BGPVPN_INDEX_KEY % bgpvpn['tenant_id'],
+                               []).append(bgpvpn['id'])
+        return indexes
+
+    def _build_kv_indexes(self, oc_client):
+        LOG.info(_LI("Building BGPVPN indexes of the key/value store"))
+        # built from the key/value store, where a BGPVPN being created or
+        # deleted is already stored or deleted
+        bgpvpns = self._scan_kv_store(oc_client)[0]
+        for key, bgpvpn_ids in self._make_kv_indexes(bgpvpns).items():
+            self._store_kv_index(oc_client, key, bgpvpn_ids)
+
+    @lockutils.synchronized(KV_INDEX_LOCK, external=True)
+    def _reconcile_kv_indexes(self, oc_client, bgpvpns=None, indexes=None):
+        """Build the BGPVPN indexes, or repair them when they lost entries
+
+        Indexes are missing for BGPVPNs stored before they existed. Index
+        updates are serialized within a host, but concurrent updates from
+        several servers can still lose entries of the global index or of
+        a tenant index. The BGPVPNs and indexes of the full scan made by
+        unfiltered admin listings are used to check all of them.
+        """
+        if bgpvpns is None:
+            bgpvpns, indexes = self._scan_kv_store(oc_client)
+        if (BGPVPN_INDEX_KEY not in indexes and
+                self._get_kv_index(oc_client, BGPVPN_INDEX_KEY) is None):
+            self._build_kv_indexes(oc_client)
+            return
+
+        for key, bgpvpn_ids in self._make_kv_indexes(bgpvpns).items():
+            if not set(bgpvpn_ids) - set(indexes.get(key) or []):
+                continue
+            # read again under the lock, the index may have been updated
+            # since the scan. Ids of BGPVPNs deleted since the scan may be
+            # added back, they are ignored when listing BGPVPNs
+            stored_ids = self._get_kv_index(oc_client, key) or []
+            missing_ids = [bgpvpn_id for bgpvpn_id in bgpvpn_ids
+                           if bgpvpn_id not in stored_ids]
+            if missing_ids:
+                LOG.warning(_LW("Adding missing BGPVPNs %(ids)s to the "
+                                "%(key)s index of the key/value store"),
+                            {'ids': missing_ids, 'key': key})
+                self._store_kv_index(oc_client, key,
+                                     stored_ids + missing_ids)
+
+    def _get_tenant_bgpvpn_ids(self, oc_client, tenant_id):
+        key = TENANT_BGPVPN_INDEX_KEY % tenant_id
+        bgpvpn_ids = self._get_kv_index(oc_client, key)
+        if bgpvpn_ids is not None:
+            return bgpvpn_ids
+
+        # a tenant without BGPVPN has no index, unless indexes were not
+        # built yet
+        if self._get_kv_index(oc_client, BGPVPN_INDEX_KEY) is None:
+            self._reconcile_kv_indexes(oc_client)
+            return self._get_kv_index(oc_client, key) or []
+        return []
+
+    @lockutils.synchronized(KV_INDEX_LOCK, external=True)
+    def _update_kv_indexes(self, oc_client, operation, bgpvpn):
+        if self._get_kv_index(oc_client, BGPVPN_INDEX_KEY) is None:
+            self._build_kv_indexes(oc_client)
+            return
+
+        for key in (BGPVPN_INDEX_KEY,
+                    TENANT_BGPVPN_INDEX_KEY % bgpvpn['tenant_id']):
+            bgpvpn_ids = self._get_kv_index(oc_client, key) or []
+            if operation == 'ADD' and bgpvpn['id'] not in bgpvpn_ids:
+                bgpvpn_ids.append(bgpvpn['id'])
+            elif operation == 'DELETE' and bgpvpn['id'] in bgpvpn_ids:
+                bgpvpn_ids.remove(bgpvpn['id'])
+            else:
+                continue
+            self._store_kv_index(oc_client, key, bgpvpn_ids)
+
+    def _retrieve_bgpvpn(self, oc_client, id):
+        try:
+            bgpvpn = json.loads(oc_client.kv_store('RETRIEVE', key=id))
+        except (oc_exc.OpenContrailAPINotFound, ValueError):
+            return
+
+        if isinstance(bgpvpn, dict) and 'bgpvpn' in bgpvpn:
+            return bgpvpn['bgpvpn']
+
     def create_bgpvpn(self, context, bgpvpn):
         bgpvpn = bgpvpn['bgpvpn']
 
@@ -170,6 +429,7 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
         bgpvpn['networks'] = []
 
         oc_client.kv_store('STORE', key=bgpvpn['id'], value={'bgpvpn': bgpvpn})
+        self._update_kv_indexes(oc_client, 'ADD', bgpvpn)
 
         return utils.make_bgpvpn_dict(bgpvpn)
 
@@ -178,17 +438,32 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
                   % (fields, filters))
 
         oc_client = self._get_opencontrail_api_client(context)
+        filters = filters or {}
+
+        if context.is_admin and not filters.get('tenant_id'):
+            # all the BGPVPNs are needed, a single scan of the key/value
+            # store is cheaper than retrieving them one by one
+            all_bgpvpns, indexes = self._scan_kv_store(oc_client)
+            self._reconcile_kv_indexes(oc_client, all_bgpvpns, indexes)
+            return [utils.make_bgpvpn_dict(bgpvpn, fields)
+                    for bgpvpn in all_bgpvpns
+                    if utils.filter_resource(bgpvpn, filters)]
+
+        if not context.is_admin:
+            tenant_ids = [context.tenant_id]
+        else:
+            tenant_ids = filters['tenant_id']
+
+        bgpvpn_ids = []
+        for tenant_id in tenant_ids:
+            bgpvpn_ids.extend(self._get_tenant_bgpvpn_ids(oc_client,
+                                                          tenant_id))
 
         bgpvpns = []
-        for kv_dict in oc_client.kv_store('RETRIEVE'):
-            try:
-                value = json.loads(kv_dict['value'])
-            except ValueError:
-                continue
-            if (isinstance(value, dict)
-                    and 'bgpvpn' in value
-                    and utils.filter_resource(value['bgpvpn'], filters)):
-                bgpvpns.append(utils.make_bgpvpn_dict(value['bgpvpn'], fields))
+        for bgpvpn_id in bgpvpn_ids:
+            bgpvpn = self._retrieve_bgpvpn(oc_client, bgpvpn_id)
+            if bgpvpn and utils.filter_resource(bgpvpn, filters):
+                bgpvpns.append(utils.make_bgpvpn_dict(bgpvpn, fields))
 
         if not context.is_admin:
             return [bgpvpn for bgpvpn in bgpvpns if
@@ -202,15 +477,10 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
 
         oc_client = self._get_opencontrail_api_client(context)
 
-        try:
-            bgpvpn = json.loads(oc_client.kv_store('RETRIEVE', key=id))
-        except (oc_exc.OpenContrailAPINotFound, ValueError):
-            raise bgpvpn.BGPVPNNotFound(id=id)
-
-        if (not isinstance(bgpvpn, dict) or 'bgpvpn' not in bgpvpn):
-            raise bgpvpn.BGPVPNNotFound(id=id)
+        bgpvpn = self._retrieve_bgpvpn(oc_client, id)
+        if not bgpvpn:
+            raise bgpvpn_ext.BGPVPNNotFound(id=id)
 
-        bgpvpn = bgpvpn['bgpvpn']
         if not context.is_admin:
             if bgpvpn['tenant_id'] != context.tenant_id:
                 raise bgpvpn_ext.BGPVPNNotFound(id=id)
@@ -247,12 +517,10 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
                 set(old_bgpvpn.get('networks', []))
             )
 
-            for network_id in removed_networks:
-                self._set_bgpvpn_association(oc_client, 'DELETE', old_bgpvpn,
-                                             network_id)
-            for network_id in added_networks:
-                self._set_bgpvpn_association(oc_client, 'ADD', bgpvpn,
-                                             network_id)
+            self._set_bgpvpn_association(oc_client, 'DELETE', old_bgpvpn,
+                                         removed_networks)
+            self._set_bgpvpn_association(oc_client, 'ADD', bgpvpn,
+                                         added_networks)
         elif (rt_keys & added_keys
               or rt_keys & changed_keys
               or rt_keys & removed_keys):
@@ -270,32 +538,40 @@ class OpenContrailBGPVPNDriver(driver_api.BGPVPNDriverBase):
         oc_client = self._get_opencontrail_api_client(context)
         self._set_bgpvpn_association(oc_client, 'DELETE', bgpvpn)
         oc_client.kv_store('DELETE', key=id)
+        self._update_kv_indexes(oc_client, 'DELETE', bgpvpn)
 
     def associate_network(self, context, bgpvpn_id, network_id):
-        LOG.debug("associate_network called for bgpvpn %s with network %s"
-                  % (bgpvpn_id, network_id))
-
         if not network_id:
             return
+        self.associate_networks(context, bgpvpn_id, [network_id])
+
+    def associate_networks(self, context, bgpvpn_id, network_ids):
+        LOG.debug("associate_networks called for bgpvpn %s with networks %s"
+                  % (bgpvpn_id, network_ids))
 
         bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
-        if network_id not in bgpvpn.get('networks', []):
-            bgpvpn['networks'] += [network_id]
+        added_networks = [network_id for network_id in network_ids
+                          if network_id not in bgpvpn.get('networks', [])]
+        if added_networks:
+            bgpvpn['networks'] += added_networks
             bgpvpn = self.update_bgpvpn(context, bgpvpn_id, {'bgpvpn': bgpvpn})
 
     def disassociate_network(self, context, bgpvpn_id, network_id):
-        LOG.debug("disassociate_network called for bgpvpn %s with network %s"
-                  % (bgpvpn_id, network_id))
-
         if not network_id:
             return
+        self.disassociate_networks(context, bgpvpn_id, [network_id])
+
+    def disassociate_networks(self, context, bgpvpn_id, network_ids):
+        LOG.debug("disassociate_networks called for bgpvpn %s with networks "
+                  "%s" % (bgpvpn_id, network_ids))
 
         bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
-        try:
-            bgpvpn.get('networks', []).remove(network_id)
-        except ValueError:
-            LOG.warning(_LW("network %(net_id)s was not associated to bgpvpn "
-                            "%(bgpvpn_id)s"), {'net_id': network_id,
-                                               'bgpvpn_id': bgpvpn_id})
-            return
+        networks = bgpvpn.get('networks', [])
+        for network_id in network_ids:
+            try:
+                networks.remove(network_id)
+            except ValueError:
+                LOG.warning(_LW("network %(net_id)s was not associated to "
+                                "bgpvpn %(bgpvpn_id)s"),
+                            {'net_id': network_id, 'bgpvpn_id': bgpvpn_id})
         bgpvpn = self.update_bgpvpn(context, bgpvpn_id, {'bgpvpn': bgpvpn})
@@ -13,12 +13,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import uuidutils
 
 import json
 import requests
+from requests import adapters
 import six
 from six.moves import http_client as httplib
 from six.moves.urllib import parse as urlparse
@@ -33,9 +35,38 @@ opencontrail_opts = [
     cfg.IntOpt('request_timeout', default=30,
                help='Timeout seconds for HTTP requests. Set it to None to '
                     'disable timeout.'),
+    cfg.IntOpt('connection_pool_size', default=10,
+               help='Maximum number of HTTP connections to the API server '
+                    'kept open and shared by all the requests of a '
+                    'process.'),
+    cfg.BoolOpt('keepalive', default=True,
+                help='Keep HTTP connections to the API server open between '
+                     'requests.'),
 ]
 CONF.register_opts(opencontrail_opts, 'APISERVER')
 
+_session = None
+
+
+@lockutils.synchronized('opencontrail-api-session')
+def get_session():
+    """Get the HTTP session shared by all the API server requests
+
+    The session holds a pool of connections to the API server, so that
+    requests reuse already established ones. Tenant and token are sent
+    as headers of each request, not as session state.
+    """
+    global _session
+    if _session is None:
+        pool_size = CONF.APISERVER.connection_pool_size
+        session = requests.Session()
+        session.mount('http://', adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size))
+        session.mount('https://', adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size))
+        _session = session
+    return _session
+
 
 class RequestHandler(object):
     """Handles processing requests."""
@@ -48,7 +79,7 @@ class RequestHandler(object):
         self._tenant = tenant
         self._token = token
 
-        self._pool = requests.Session()
+        self._pool = get_session()
         self._resource = ""
         self._id = ""
 
@@ -122,6 +153,9 @@ class RequestHandler(object):
             'timeout': self._request_timeout,
         }
 
+        if not CONF.APISERVER.keepalive:
+            req_params['headers']['Connection'] = 'close'
+
         if data:
             req_params.update({'data': json.dumps(data)})
 
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
 from neutron import context
 
 from networking_bgpvpn.neutron.db.bgpvpn_db import BGPVPNPluginDb
@@ -26,6 +28,19 @@ class BgpvpnDBTestCase(test_plugin.BgpvpnTestCaseMixin):
         super(BgpvpnDBTestCase, self).setUp()
         self.ctx = context.get_admin_context()
         self.plugin_db = BGPVPNPluginDb()
+        self.bgpvpn_cache = BGPVPNPluginDb.get_bgpvpn_cache()
+        self.bgpvpn_cache.clear()
+
+    def _bgpvpn_data(self, **kwargs):
+        bgpvpn_data = {"type": "l3",
+                       "name": "",
+                       "route_targets": ["64512:1"],
+                       "import_targets": [],
+                       "export_targets": [],
+                       "route_distinguishers": [],
+                       "auto_aggregate": False}
+        bgpvpn_data.update(kwargs)
+        return {"bgpvpn": bgpvpn_data}
 
     def test_bgpvpn_create_update_delete(self):
         with self.network() as net:
@@ -134,3 +149,216 @@ class BgpvpnDBTestCase(test_plugin.BgpvpnTestCaseMixin):
                 self.assoc_net(id, net_id=net_id, do_disassociate=False)
             bgpvpn_db = self.plugin_db.get_bgpvpn(self.ctx, id)
             self.assertEqual([], bgpvpn_db['networks'])
+
+    def test_db_get_bgpvpns_filtered_by_route_target(self):
+        bgpvpn1 = self.plugin_db.create_bgpvpn(
+            self.ctx, self._bgpvpn_data(route_targets=["64512:100"]))
+        self.plugin_db.create_bgpvpn(
+            self.ctx, self._bgpvpn_data(route_targets=["64512:200"],
+                                        import_targets=["64512:100"]))
+
+        bgpvpns = self.plugin_db.get_bgpvpns(
+            self.ctx, filters={'route_targets': ["64512:100"]})
+        self.assertEqual([bgpvpn1['id']], [b['id'] for b in bgpvpns])
+
+        bgpvpns = self.plugin_db.get_bgpvpns(
+            self.ctx, filters={'import_targets': ["64512:100"]})
+        self.assertEqual(1, len(bgpvpns))
+        self.assertEqual(["64512:200"], bgpvpns[0]['route_targets'])
+
+    def test_db_get_bgpvpns_filtered_by_empty_route_targets(self):
+        self.plugin_db.create_bgpvpn(self.ctx, self._bgpvpn_data())
+        self.assertEqual([], self.plugin_db.get_bgpvpns(
+            self.ctx, filters={'route_targets': []}))
+
+    def test_db_bgpvpn_duplicate_route_targets(self):
+        bgpvpn = self.plugin_db.create_bgpvpn(
+            self.ctx, self._bgpvpn_data(
+                import_targets=["64512:2", "64512:1", "64512:2"]))
+        self.assertEqual(["64512:1", "64512:2"], sorted(
+            self.plugin_db.get_bgpvpn(self.ctx,
+                                      bgpvpn['id'])['import_targets']))
+
+        self.plugin_db.update_bgpvpn(
+            self.ctx, bgpvpn['id'],
+            {"bgpvpn": {"export_targets": ["64512:3", "64512:3"]}})
+        self.assertEqual(["64512:3"], self.plugin_db.get_bgpvpn(
+            self.ctx, bgpvpn['id'])['export_targets'])
+
+    def test_db_bgpvpn_route_targets_order(self):
+        rts = ["64512:2", "64512:10", "64512:1"]
+        bgpvpn = self.plugin_db.create_bgpvpn(
+            self.ctx, self._bgpvpn_data(route_targets=rts))
+        self.assertEqual(rts, bgpvpn['route_targets'])
+        # read back from the database in a new session
+        self.bgpvpn_cache.clear()
+        self.assertEqual(rts, self.plugin_db.get_bgpvpn(
+            context.get_admin_context(), bgpvpn['id'])['route_targets'])
+
+        rts = ["64512:1", "64512:3", "64512:2"]
+        bgpvpn = self.plugin_db.update_bgpvpn(
+            self.ctx, bgpvpn['id'], {"bgpvpn": {"route_targets": rts}})
+        self.assertEqual(rts, bgpvpn['route_targets'])
+        self.bgpvpn_cache.clear()
+        self.assertEqual(rts, self.plugin_db.get_bgpvpns(
+            context.get_admin_context())[0]['route_targets'])
+
+    def test_db_get_bgpvpns_fields(self):
+        with self.network() as net:
+            net_id = net['network']['id']
+            with self.bgpvpn() as bgpvpn:
+                id = bgpvpn['bgpvpn']['id']
+                with self.assoc_net(id, net_id):
+                    bgpvpns = self.plugin_db.get_bgpvpns(
+                        self.ctx, fields=['id', 'name'])
+                    self.assertEqual([{'id': id, 'name': 'bgpvpn1'}],
+                                     bgpvpns)
+
+                    bgpvpns = self.plugin_db.get_bgpvpns(
+                        self.ctx, fields=['id', 'networks'])
+                    self.assertEqual([{'id': id, 'networks': [net_id]}],
+                                     bgpvpns)
+
+    def test_db_find_bgpvpns_for_networks(self):
+        with self.network() as net1, self.network() as net2:
+            net1_id = net1['network']['id']
+            net2_id = net2['network']['id']
+            with self.bgpvpn() as bgpvpn:
+                id = bgpvpn['bgpvpn']['id']
+                with self.assoc_net(id, net_id=net1_id):
+                    bgpvpns = self.plugin_db.find_bgpvpns_for_networks(
+                        self.ctx, [net1_id, net2_id])
+                    self.assertEqual(set([net1_id, net2_id]), set(bgpvpns))
+                    self.assertEqual([id],
+                                     [b['id'] for b in bgpvpns[net1_id]])
+                    self.assertEqual([net1_id],
+                                     bgpvpns[net1_id][0]['networks'])
+                    self.assertEqual([], bgpvpns[net2_id])
+
+    def test_db_create_delete_bgpvpns(self):
+        bgpvpns = self.plugin_db.create_bgpvpns(
+            self.ctx, [self._bgpvpn_data(), self._bgpvpn_data()])
+        ids = [bgpvpn['id'] for bgpvpn in bgpvpns]
+        self.assertEqual(2, len(self.plugin_db.get_bgpvpns(self.ctx)))
+
+        self.assertRaises(BGPVPNNotFound,
+                          self.plugin_db.delete_bgpvpns,
+                          self.ctx, ids + ['unknown'])
+        self.assertEqual(2, len(self.plugin_db.get_bgpvpns(self.ctx)))
+
+        deleted = self.plugin_db.delete_bgpvpns(self.ctx, ids)
+        self.assertEqual(set(ids), set(bgpvpn['id'] for bgpvpn in deleted))
+        self.assertEqual([], self.plugin_db.get_bgpvpns(self.ctx))
+
+    def test_db_get_bgpvpns_paginated(self):
+        bgpvpns = self.plugin_db.create_bgpvpns(
+            self.ctx, [self._bgpvpn_data(name=name)
+                       for name in ("c", "a", "b")])
+        ids = dict((bgpvpn['name'], bgpvpn['id']) for bgpvpn in bgpvpns)
+        sorts = [('name', True), ('id', True)]
+
+        page = self.plugin_db.get_bgpvpns(self.ctx, fields=['name'],
+                                          sorts=sorts, limit=2)
+        self.assertEqual([{'name': 'a'}, {'name': 'b'}], page)
+
+        page = self.plugin_db.get_bgpvpns(self.ctx, fields=['name'],
+                                          sorts=sorts, limit=2,
+                                          marker=ids['b'])
+        self.assertEqual([{'name': 'c'}], page)
+
+        page = self.plugin_db.get_bgpvpns(self.ctx, fields=['name'],
+                                          sorts=sorts, limit=2,
+                                          marker=ids['c'], page_reverse=True)
+        self.assertEqual([{'name': 'a'}, {'name': 'b'}], page)
+
+    def test_db_iter_bgpvpns(self):
+        bgpvpns = self.plugin_db.create_bgpvpns(
+            self.ctx, [self._bgpvpn_data() for _i in range(5)])
+
+        iterated = list(self.plugin_db.iter_bgpvpns(self.ctx, fields=['id'],
+                                                    chunk_size=2))
+        self.assertEqual(sorted(bgpvpn['id'] for bgpvpn in bgpvpns),
+                         [bgpvpn['id'] for bgpvpn in iterated])
+
+    def test_db_get_bgpvpn_cached(self):
+        bgpvpn = self.plugin_db.create_bgpvpn(self.ctx, self._bgpvpn_data())
+        stats = self.bgpvpn_cache.stats()
+
+        self.plugin_db.get_bgpvpn(self.ctx, bgpvpn['id'])
+        self.assertEqual(stats['misses'] + 1,
+                         self.bgpvpn_cache.stats()['misses'])
+        cached = self.plugin_db.get_bgpvpn(self.ctx, bgpvpn['id'])
+        self.assertEqual(stats['hits'] + 1, self.bgpvpn_cache.stats()['hits'])
+        self.assertEqual(["64512:1"], cached['route_targets'])
+
+        # returned dicts are copies of the cached ones
+        cached['route_targets'].append("64512:2")
+        self.assertEqual(["64512:1"], self.plugin_db.get_bgpvpn(
+            self.ctx, bgpvpn['id'])['route_targets'])
+
+        # writes invalidate the cached bgpvpn
+        self.plugin_db.update_bgpvpn(self.ctx, bgpvpn['id'],
+                                     {"bgpvpn": {"name": "foo"}})
+        self.assertEqual("foo", self.plugin_db.get_bgpvpn(
+            self.ctx, bgpvpn['id'])['name'])
+
+        # so do writes of another worker, which bump the revision, the
+        # stale copy counting as a miss
+        stats = self.bgpvpn_cache.stats()
+        self.plugin_db._bump_revision(self.ctx, [bgpvpn['id']])
+        self.plugin_db.get_bgpvpn(self.ctx, bgpvpn['id'])
+        self.assertEqual(stats['misses'] + 1,
+                         self.bgpvpn_cache.stats()['misses'])
+        self.assertEqual(stats['hits'], self.bgpvpn_cache.stats()['hits'])
+
+        self.plugin_db.delete_bgpvpn(self.ctx, bgpvpn['id'])
+        self.assertRaises(BGPVPNNotFound,
+                          self.plugin_db.get_bgpvpn,
+                          self.ctx, bgpvpn['id'])
+
+    def test_db_get_bgpvpn_cached_single_query(self):
+        with self.network() as net:
+            net_id = net['network']['id']
+            bgpvpn = self.plugin_db.create_bgpvpn(self.ctx,
+                                                  self._bgpvpn_data())
+            self.plugin_db.associate_network(self.ctx, bgpvpn['id'], net_id)
+            self.plugin_db.get_bgpvpn(self.ctx, bgpvpn['id'])
+            with mock.patch.object(self.plugin_db, '_get_bgpvpn') as get, \
+                    mock.patch.object(self.plugin_db,
+                                      '_get_network_ids') as get_net_ids:
+                cached = self.plugin_db.get_bgpvpn(self.ctx, bgpvpn['id'])
+                self.assertFalse(get.called)
+                self.assertFalse(get_net_ids.called)
+            self.assertEqual([net_id], cached['networks'])
+
+    def test_db_bgpvpn_revision(self):
+        with self.network() as net:
+            bgpvpn = self.plugin_db.create_bgpvpn(self.ctx,
+                                                  self._bgpvpn_data())
+            id = bgpvpn['id']
+            revisions = [self.plugin_db.get_bgpvpn_revision(self.ctx, id)]
+
+            self.plugin_db.update_bgpvpn(
+                self.ctx, id, {"bgpvpn": {"route_targets": ["64512:2"]}})
+            revisions.append(self.plugin_db.get_bgpvpn_revision(self.ctx, id))
+            self.plugin_db.associate_network(self.ctx, id,
+                                             net['network']['id'])
+            revisions.append(self.plugin_db.get_bgpvpn_revision(self.ctx, id))
+            self.plugin_db.disassociate_network(self.ctx, id,
+                                                net['network']['id'])
+            revisions.append(self.plugin_db.get_bgpvpn_revision(self.ctx, id))
+            self.assertEqual(sorted(set(revisions)), revisions)
+
+            self.plugin_db.delete_bgpvpn(self.ctx, id)
+            self.assertIsNone(self.plugin_db.get_bgpvpn_revision(self.ctx, id))
+
+    def test_db_get_bgpvpn_cache_stale_revision(self):
+        bgpvpn = self.plugin_db.create_bgpvpn(self.ctx, self._bgpvpn_data())
+        id = bgpvpn['id']
+        self.plugin_db.get_bgpvpn(self.ctx, id)
+        # a write from another worker does not invalidate the local cache
+        with mock.patch.object(self.plugin_db, '_invalidate_bgpvpns'):
+            self.plugin_db.update_bgpvpn(self.ctx, id,
+                                         {"bgpvpn": {"name": "foo"}})
+        self.assertEqual("foo",
+                         self.plugin_db.get_bgpvpn(self.ctx, id)['name'])
@@ -19,7 +19,11 @@ import webob.exc
 from neutron.common.constants import DEVICE_OWNER_DHCP
 from neutron.common.constants import PORT_STATUS_ACTIVE
 from neutron.common.constants import PORT_STATUS_DOWN
+from neutron import context
+from neutron.plugins.ml2 import models as ml2_models
+from oslo_config import cfg
 
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe import bagpipe
 from networking_bgpvpn.tests.unit.services import test_plugin
 
 
@@ -27,13 +31,22 @@ class TestBagpipeCommon(test_plugin.BgpvpnTestCaseMixin):
 
     def setUp(self):
         self.mocked_bagpipeAPI = mock.patch(
-            'networking_bagpipe_l2.agent.bgpvpn.rpc_client'
-            '.BGPVPNAgentNotifyApi').start().return_value
+            'networking_bgpvpn.neutron.services.service_drivers.bagpipe.rpc'
+            '.BaGPipeBGPVPNAgentNotifyApi',
+            autospec=True).start().return_value
 
         provider = ('networking_bgpvpn.neutron.services.service_drivers.'
                     'bagpipe.bagpipe.BaGPipeBGPVPNDriver')
         super(TestBagpipeCommon, self).setUp(service_provider=provider)
 
+    def _bind_port(self, port, host):
+        ctx = context.get_admin_context()
+        with ctx.session.begin(subtransactions=True):
+            binding = ml2_models.PortBinding(port_id=port['port']['id'],
+                                             host=host,
+                                             vif_type='ovs')
+            ctx.session.add(binding)
+
 
 class TestBagpipeServiceDriver(TestBagpipeCommon):
 
@@ -41,6 +54,7 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
         mocked_update = self.mocked_bagpipeAPI.update_bgpvpn
         with self.port() as port1:
             net_id = port1['port']['network_id']
+            self._bind_port(port1, 'host1')
             with self.bgpvpn() as bgpvpn:
                 id = bgpvpn['bgpvpn']['id']
                 rt = bgpvpn['bgpvpn']['route_targets']
@@ -52,12 +66,14 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                                         {'import_rt': rt,
                                          'export_rt': rt}}
                     mocked_update.assert_called_once_with(mock.ANY,
-                                                          formatted_bgpvpn)
+                                                          formatted_bgpvpn,
+                                                          'host1')
 
     def test_bagpipe_disassociate_net(self):
         mocked_delete = self.mocked_bagpipeAPI.delete_bgpvpn
         with self.port() as port1:
             net_id = port1['port']['network_id']
+            self._bind_port(port1, 'host1')
             with self.bgpvpn() as bgpvpn:
                 id = bgpvpn['bgpvpn']['id']
                 rt = bgpvpn['bgpvpn']['route_targets']
@@ -77,12 +93,14 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                                         {'import_rt': rt,
                                          'export_rt': rt}}
                     mocked_delete.assert_called_once_with(mock.ANY,
-                                                          formatted_bgpvpn)
+                                                          formatted_bgpvpn,
+                                                          'host1')
 
     def test_bagpipe_update_bgpvpn_rt(self):
         mocked_update = self.mocked_bagpipeAPI.update_bgpvpn
         with self.port() as port1:
             net_id = port1['port']['network_id']
+            self._bind_port(port1, 'host1')
             with self.bgpvpn() as bgpvpn:
                 id = bgpvpn['bgpvpn']['id']
                 rt = ['6543:21']
@@ -98,12 +116,64 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                                  bgpvpn['bgpvpn']['id'],
                                  update_data)
                     mocked_update.assert_called_once_with(mock.ANY,
-                                                          formatted_bgpvpn)
+                                                          formatted_bgpvpn,
+                                                          'host1')
+
+    def test_bagpipe_update_bgpvpn_name(self):
+        mocked_update = self.mocked_bagpipeAPI.update_bgpvpn
+        with self.port() as port1:
+            net_id = port1['port']['network_id']
+            self._bind_port(port1, 'host1')
+            with self.bgpvpn() as bgpvpn:
+                id = bgpvpn['bgpvpn']['id']
+                with self.assoc_net(id, net_id):
+                    update_data = {'bgpvpn': {'name': 'foo'}}
+                    mocked_update.reset_mock()
+                    self._update('bgpvpn/bgpvpns', id, update_data)
+                    self.assertFalse(mocked_update.called)
+
+    def test_bagpipe_route_target_changes(self):
+        driver = self.bgpvpn_plugin.driver
+        old_bgpvpn = {'type': 'l3',
+                      'route_targets': ['12345:1'],
+                      'import_targets': ['12345:2'],
+                      'export_targets': []}
+        bgpvpn = {'type': 'l3',
+                  'route_targets': ['12345:1'],
+                  'import_targets': ['12345:3'],
+                  'export_targets': []}
+        self.assertEqual(
+            {'l3vpn': {'import_rt': (set(['12345:3']), set(['12345:2']))}},
+            driver._get_route_target_changes(old_bgpvpn, bgpvpn))
+        self.assertEqual(
+            {}, driver._get_route_target_changes(bgpvpn, dict(bgpvpn)))
+
+    def test_bagpipe_format_network_route_targets(self):
+        driver = self.bgpvpn_plugin.driver
+        bgpvpns = [{'type': 'l3',
+                    'route_targets': ['12345:2', '12345:1'],
+                    'import_targets': ['12345:1'],
+                    'export_targets': []},
+                   {'type': 'l3',
+                    'route_targets': ['12345:2'],
+                    'import_targets': [],
+                    'export_targets': ['12345:4']},
+                   {'type': 'l2',
+                    'route_targets': ['12345:5'],
+                    'import_targets': [],
+                    'export_targets': []}]
+        self.assertEqual(
+            {'l3vpn': {'import_rt': ['12345:1', '12345:2'],
+                       'export_rt': ['12345:1', '12345:2', '12345:4']},
+             'l2vpn': {'import_rt': ['12345:5'],
+                       'export_rt': ['12345:5']}},
+            driver._format_bgpvpn_network_route_targets(bgpvpns))
 
     def test_bagpipe_delete_bgpvpn(self):
         mocked_delete = self.mocked_bagpipeAPI.delete_bgpvpn
         with self.port() as port1:
             net_id = port1['port']['network_id']
+            self._bind_port(port1, 'host1')
             with self.bgpvpn(do_delete=False) as bgpvpn:
                 id = bgpvpn['bgpvpn']['id']
                 rt = bgpvpn['bgpvpn']['route_targets']
@@ -116,7 +186,123 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                                         {'import_rt': rt,
                                          'export_rt': rt}}
                     mocked_delete.assert_called_once_with(mock.ANY,
-                                                          formatted_bgpvpn)
+                                                          formatted_bgpvpn,
+                                                          'host1')
+
+    def test_bagpipe_network_route_targets_view(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.port() as port1:
+            net_id = port1['port']['network_id']
+            with self.bgpvpn() as bgpvpn:
+                id = bgpvpn['bgpvpn']['id']
+                with self.assoc_net(id, net_id), \
+                        mock.patch.object(
+                            driver.bgpvpn_db, 'find_bgpvpns_for_network',
+                            wraps=driver.bgpvpn_db.find_bgpvpns_for_network
+                        ) as mock_find:
+                    ctx = context.get_admin_context()
+                    rts = driver._get_network_route_targets(ctx, net_id)
+                    self.assertEqual({'l3vpn': {'import_rt': ['1234:56'],
+                                                'export_rt': ['1234:56']}},
+                                     rts)
+                    driver._get_network_route_targets(ctx, net_id)
+                    self.assertEqual(1, mock_find.call_count)
+
+                    update_data = {'bgpvpn': {'route_targets': ['6543:21']}}
+                    self._update('bgpvpn/bgpvpns', id, update_data)
+                    rts = driver._get_network_route_targets(ctx, net_id)
+                    self.assertEqual({'l3vpn': {'import_rt': ['6543:21'],
+                                                'export_rt': ['6543:21']}},
+                                     rts)
+                    self.assertEqual(2, mock_find.call_count)
+                self.assertIsNone(
+                    driver._get_network_route_targets(ctx, net_id))
+
+    def test_bagpipe_is_vpn_network(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.network() as net1, self.network() as net2:
+            net1_id = net1['network']['id']
+            net2_id = net2['network']['id']
+            self.assertFalse(driver._is_vpn_network(net1_id))
+            with self.bgpvpn() as bgpvpn:
+                with self.assoc_net(bgpvpn['bgpvpn']['id'], net1_id):
+                    # added on association, before the next refresh
+                    self.assertTrue(driver._is_vpn_network(net1_id))
+                    self.assertFalse(driver._is_vpn_network(net2_id))
+
+                    driver._vpn_networks_refreshed_at = None
+                    self.assertTrue(driver._is_vpn_network(net1_id))
+                driver._vpn_networks_refreshed_at = None
+                self.assertFalse(driver._is_vpn_network(net1_id))
+
+    def test_bagpipe_network_hosts(self):
+        with self.network() as net1, self.network() as net2:
+            net1_id = net1['network']['id']
+            net2_id = net2['network']['id']
+            with self.port(network=net1) as port1, \
+                    self.port(network=net1) as port2, \
+                    self.port(network=net1) as port3, \
+                    self.port(network=net2):
+                self._bind_port(port1, 'host1')
+                self._bind_port(port2, 'host1')
+                self._bind_port(port3, 'host2')
+                ctx = context.get_admin_context()
+                self.assertEqual(
+                    {net1_id: set(['host1', 'host2'])},
+                    bagpipe.get_network_hosts(ctx, [net1_id, net2_id]))
+
+    def test_bagpipe_port_host(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.port() as port1:
+            port_id = port1['port']['id']
+            ctx = context.get_admin_context()
+            self._bind_port(port1, 'host1')
+            self.assertEqual({port_id: 'host1'},
+                             bagpipe.get_port_hosts(ctx, [port_id]))
+            self.assertEqual('host1', driver._get_port_host(port1['port']))
+
+            # port moved by another worker
+            with ctx.session.begin(subtransactions=True):
+                (ctx.session.query(ml2_models.PortBinding).
+                 filter_by(port_id=port_id).update({'host': 'host2'}))
+            self.assertEqual('host2', driver._get_port_host(port1['port']))
+
+    def test_bagpipe_port_host_from_port_dict(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.port() as port1:
+            port = dict(port1['port'], **{'binding:host_id': 'host3'})
+            with mock.patch.object(bagpipe, 'get_port_hosts') as mock_hosts:
+                self.assertEqual('host3', driver._get_port_host(port))
+                self.assertFalse(mock_hosts.called)
+
+    def test_bagpipe_get_bgpvpn_port_infos_for_host(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.network() as net1, self.network() as net2, \
+                self.subnet(network=net1, cidr='10.0.0.0/24') as subnet1, \
+                self.subnet(network=net2, cidr='10.1.0.0/24'):
+            net1_id = net1['network']['id']
+            with self.port(subnet=subnet1) as port1, \
+                    self.port(network=net2) as port2, \
+                    self.port(subnet=subnet1) as port3:
+                self._bind_port(port1, 'host1')
+                self._bind_port(port2, 'host1')
+                self._bind_port(port3, 'host2')
+                with self.bgpvpn() as bgpvpn:
+                    with self.assoc_net(bgpvpn['bgpvpn']['id'], net1_id):
+                        ctx = context.get_admin_context()
+                        port_infos = driver.get_bgpvpn_port_infos_for_host(
+                            ctx, 'host1')
+                        port = port1['port']
+                        self.assertEqual(
+                            [{'id': port['id'],
+                              'network_id': net1_id,
+                              'mac_address': port['mac_address'],
+                              'ip_address':
+                                  port['fixed_ips'][0]['ip_address'] + '/24',
+                              'gateway_ip': '10.0.0.1',
+                              'l3vpn': {'import_rt': ['1234:56'],
+                                        'export_rt': ['1234:56']}}],
+                            port_infos)
 
 
 class TestBagpipeServiceDriverCallbacks(TestBagpipeCommon):
@@ -144,6 +330,8 @@ class TestBagpipeServiceDriverCallbacks(TestBagpipeCommon):
             return_value=self.testhost
         )
 
+        self.bagpipe_driver._is_vpn_network = mock.Mock(return_value=True)
+
         self.mock_attach_rpc = self.mocked_bagpipeAPI.attach_port_on_bgpvpn
         self.mock_detach_rpc = self.mocked_bagpipeAPI.detach_port_from_bgpvpn
 
@@ -170,6 +358,34 @@ class TestBagpipeServiceDriverCallbacks(TestBagpipeCommon):
                 self._build_expected_return_active(port['port']),
                 self.testhost)
 
+    def test_bagpipe_callback_to_rpc_update_status_changed(self):
+        with self.port() as port:
+            original_port = dict(port['port'], status=PORT_STATUS_DOWN)
+            port['port']['status'] = PORT_STATUS_ACTIVE
+            self.bagpipe_driver.registry_port_updated(
+                None, None, None,
+                context=None,
+                port=port['port'],
+                original_port=original_port
+            )
+            self.mock_attach_rpc.assert_called_once_with(
+                mock.ANY,
+                self._build_expected_return_active(port['port']),
+                self.testhost)
+
+    def test_bagpipe_callback_to_rpc_update_ignore_unrelated_change(self):
+        with self.port() as port:
+            port['port']['status'] = PORT_STATUS_ACTIVE
+            original_port = dict(port['port'], name='old_name')
+            self.bagpipe_driver.registry_port_updated(
+                None, None, None,
+                context=None,
+                port=port['port'],
+                original_port=original_port
+            )
+            self.assertFalse(self.bagpipe_driver._get_port_host.called)
+            self.assertFalse(self.mock_attach_rpc.called)
+
     def test_bagpipe_callback_to_rpc_update_down(self):
         with self.port() as port:
             port['port']['status'] = PORT_STATUS_DOWN
@@ -225,3 +441,181 @@ class TestBagpipeServiceDriverCallbacks(TestBagpipeCommon):
                 port=port['port']
             )
             self.assertFalse(self.mock_detach_rpc.called)
+
+    def test_bagpipe_callback_to_rpc_update_ignore_non_vpn_network(self):
+        self.bagpipe_driver._is_vpn_network.return_value = False
+        with self.port() as port:
+            port['port']['status'] = PORT_STATUS_ACTIVE
+            self.bagpipe_driver.registry_port_updated(
+                None, None, None,
+                context=None,
+                port=port['port']
+            )
+            self.assertFalse(self.bagpipe_driver._get_port_host.called)
+            self.assertFalse(self.mock_attach_rpc.called)
+
+    def test_bagpipe_callback_to_rpc_deleted_ignore_non_vpn_network(self):
+        self.bagpipe_driver._is_vpn_network.return_value = False
+        with self.port() as port:
+            port['port']['status'] = PORT_STATUS_DOWN
+            self.bagpipe_driver.registry_port_deleted(
+                None, None, None,
+                context=None,
+                port=port['port']
+            )
+            self.assertFalse(self.bagpipe_driver._get_port_host.called)
+            self.assertFalse(self.mock_detach_rpc.called)
+
+    def test_bagpipe_callback_to_rpc_attach_not_suppressed(self):
+        with self.port() as port:
+            port['port']['status'] = PORT_STATUS_ACTIVE
+            for i in range(2):
+                self.bagpipe_driver.registry_port_updated(
+                    None, None, None,
+                    context=None,
+                    port=port['port']
+                )
+            # the port may have been detached by another worker since
+            self.assertEqual(2, self.mock_attach_rpc.call_count)
+            self.assertEqual({'sent': 2, 'suppressed': 0},
+                             self.bagpipe_driver.notification_stats())
+
+    def test_bagpipe_suppress_duplicate_update_bgpvpn(self):
+        mocked_update = self.mocked_bagpipeAPI.update_bgpvpn
+        formatted_bgpvpn = {'id': 'bgpvpn-id',
+                            'network_id': 'net-id',
+                            'l3vpn': {'import_rt': ['12345:1'],
+                                      'export_rt': ['12345:1']}}
+        for i in range(2):
+            self.bagpipe_driver._cast_bgpvpn(None, 'update_bgpvpn',
+                                             formatted_bgpvpn, 'host1', 1)
+        self.assertEqual(1, mocked_update.call_count)
+        self.assertEqual({'sent': 1, 'suppressed': 1},
+                         self.bagpipe_driver.notification_stats())
+
+        # the same route targets at a later revision, as when another
+        # worker changed them and this one changed them back
+        self.bagpipe_driver._cast_bgpvpn(None, 'update_bgpvpn',
+                                         formatted_bgpvpn, 'host1', 3)
+        self.assertEqual(2, mocked_update.call_count)
+
+        # a delete forgets the last update sent
+        self.bagpipe_driver._cast_bgpvpn(None, 'delete_bgpvpn',
+                                         formatted_bgpvpn, 'host1')
+        self.bagpipe_driver._cast_bgpvpn(None, 'update_bgpvpn',
+                                         formatted_bgpvpn, 'host1', 3)
+        self.assertEqual(3, mocked_update.call_count)
+
+    @mock.patch('time.time')
+    def test_bagpipe_duplicate_update_bgpvpn_expired(self, mock_time):
+        mock_time.return_value = 1000
+        mocked_update = self.mocked_bagpipeAPI.update_bgpvpn
+        formatted_bgpvpn = {'id': 'bgpvpn-id',
+                            'network_id': 'net-id',
+                            'l3vpn': {'import_rt': ['12345:1'],
+                                      'export_rt': ['12345:1']}}
+        self.bagpipe_driver._cast_bgpvpn(None, 'update_bgpvpn',
+                                         formatted_bgpvpn, 'host1', 1)
+        mock_time.return_value += (
+            cfg.CONF.bagpipe_bgpvpn.duplicate_notification_ttl + 1)
+        self.bagpipe_driver._cast_bgpvpn(None, 'update_bgpvpn',
+                                         formatted_bgpvpn, 'host1', 1)
+        self.assertEqual(2, mocked_update.call_count)
+
+    @mock.patch('eventlet.spawn_after')
+    def test_bagpipe_callback_to_rpc_coalesced(self, mock_spawn_after):
+        self.config(port_notification_window=1, group='bagpipe_bgpvpn')
+        with self.port() as port1, self.port() as port2:
+            port1['port']['status'] = PORT_STATUS_ACTIVE
+            port2['port']['status'] = PORT_STATUS_ACTIVE
+            for port in (port1, port2):
+                self.bagpipe_driver.registry_port_updated(
+                    None, None, None,
+                    context=None,
+                    port=port['port']
+                )
+            port2['port']['status'] = PORT_STATUS_DOWN
+            self.bagpipe_driver.registry_port_updated(
+                None, None, None,
+                context=None,
+                port=port2['port']
+            )
+            self.assertFalse(self.mock_attach_rpc.called)
+            self.assertFalse(self.mock_detach_rpc.called)
+            mock_spawn_after.assert_called_once_with(
+                1, self.bagpipe_driver._flush_port_events, self.testhost)
+
+            self.bagpipe_driver._flush_port_events(self.testhost)
+            self.mock_attach_rpc.assert_called_once_with(
+                None,
+                self._build_expected_return_active(port1['port']),
+                self.testhost
+            )
+            self.mock_detach_rpc.assert_called_once_with(
+                None,
+                self._build_expected_return_down(port2['port']),
+                self.testhost
+            )
+
+    @mock.patch('eventlet.spawn_after')
+    def test_bagpipe_callback_to_rpc_coalesced_rts_read_at_flush(
+            self, mock_spawn_after):
+        self.config(port_notification_window=1, group='bagpipe_bgpvpn')
+        mock_retrieve = (
+            self.bagpipe_driver._retrieve_bgpvpn_network_info_for_port)
+        with self.port() as port:
+            port['port']['status'] = PORT_STATUS_ACTIVE
+            self.bagpipe_driver.registry_port_updated(
+                None, None, None,
+                context=None,
+                port=port['port']
+            )
+            self.assertFalse(mock_retrieve.called)
+
+            # route targets changed within the window
+            self.bgpvpn_info['l3vpn'] = {'import_rt': ['12345:2'],
+                                         'export_rt': ['12345:2']}
+            self.bagpipe_driver._flush_port_events(self.testhost)
+            self.mock_attach_rpc.assert_called_once_with(
+                None,
+                self._build_expected_return_active(port['port']),
+                self.testhost
+            )
+
+    @mock.patch('eventlet.spawn_after')
+    def test_bagpipe_callback_to_rpc_coalesced_network_disassociated(
+            self, mock_spawn_after):
+        self.config(port_notification_window=1, group='bagpipe_bgpvpn')
+        with self.port() as port:
+            port['port']['status'] = PORT_STATUS_ACTIVE
+            self.bagpipe_driver.registry_port_updated(
+                None, None, None,
+                context=None,
+                port=port['port']
+            )
+
+            # the network is disassociated from its BGPVPN, and the agent
+            # notified, within the window
+            mock_retrieve = (
+                self.bagpipe_driver._retrieve_bgpvpn_network_info_for_port)
+            mock_retrieve.return_value = None
+            self.bagpipe_driver._flush_port_events(self.testhost)
+            self.assertFalse(self.mock_attach_rpc.called)
+
+    @mock.patch('eventlet.spawn_after')
+    def test_bagpipe_callback_to_rpc_coalesced_batch_size(self,
+                                                          mock_spawn_after):
+        self.config(port_notification_window=1,
+                    port_notification_batch_size=2,
+                    group='bagpipe_bgpvpn')
+        with self.port() as port1, self.port() as port2:
+            for port in (port1, port2):
+                port['port']['status'] = PORT_STATUS_ACTIVE
+                self.bagpipe_driver.registry_port_updated(
+                    None, None, None,
+                    context=None,
+                    port=port['port']
+                )
+            self.assertEqual(2, self.mock_attach_rpc.call_count)
+            mock_spawn_after.return_value.cancel.assert_called_once_with()
+            self.assertEqual({}, self.bagpipe_driver._pending_port_events)
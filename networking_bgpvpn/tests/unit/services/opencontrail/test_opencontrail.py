@@ -0,0 +1,402 @@
+# Copyright (c) 2015 Cloudwatt.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import eventlet
+import json
+import mock
+
+from oslo_concurrency.fixture import lockutils as lockutils_fixture
+
+from neutron.common import exceptions as n_exc
+from neutron import context
+from neutron.tests import base
+
+from networking_bgpvpn.neutron.services.service_drivers.opencontrail import \
+    exceptions as oc_exc
+from networking_bgpvpn.neutron.services.service_drivers.opencontrail import \
+    opencontrail
+
+
+class FakeOpenContrailClient(object):
+    """In-memory OpenContrail key/value store, route targets and networks
+
+    The state is shared by the shallow copies of the client the driver makes
+    for its concurrent requests.
+    """
+
+    def __init__(self):
+        self.kv = {}
+        # network id -> routing instance id
+        self.networks = {}
+        # route target name -> route target id
+        self.rts = {}
+        self.refs = set()
+        self.ref_updates = []
+        self.in_flight = [0, 0]
+        self.calls = collections.Counter()
+        self.shows = []
+
+    def show(self, resource, id, fields=None):
+        self.calls['show', resource] += 1
+        self.shows.append((resource, id, fields))
+        if resource == 'Route Target':
+            if id not in self.rts.values():
+                raise oc_exc.OpenContrailAPINotFound(resource=resource, id=id)
+            rt = {'uuid': id}
+            back_refs = [ri_id for ri_id, rt_id in self.refs if rt_id == id]
+            if back_refs:
+                rt['routing_instance_back_refs'] = back_refs
+            return rt
+        if id not in self.networks:
+            raise oc_exc.OpenContrailAPINotFound(resource=resource, id=id)
+        fq_name = ['default-domain', 'project', id]
+        return {'fq_name': fq_name,
+                'routing_instances': [{'to': fq_name + [id],
+                                       'uuid': self.networks[id]}]}
+
+    def fqname_to_id(self, resource, fq_name):
+        self.calls['fqname_to_id'] += 1
+        name = ':'.join(fq_name)
+        if name not in self.rts:
+            raise oc_exc.OpenContrailAPINotFound(resource='FQName to ID',
+                                                 id='')
+        return self.rts[name]
+
+    def create(self, resource, body):
+        self.calls['create', resource] += 1
+        name = body['route-target']['fq_name'][0]
+        self.rts[name] = 'rt-%s' % name.split(':', 1)[1]
+        return {'uuid': self.rts[name]}
+
+    def remove(self, resource, id):
+        self.calls['remove', resource] += 1
+        for name, rt_id in list(self.rts.items()):
+            if rt_id == id:
+                del self.rts[name]
+
+    def ref_update(self, **kwargs):
+        # count the requests in progress while yielding to the other green
+        # threads, as a request to the API server would
+        self.in_flight[0] += 1
+        self.in_flight[1] = max(self.in_flight)
+        eventlet.sleep(0)
+        self.in_flight[0] -= 1
+
+        ref = (kwargs['resource_uuid'], kwargs['ref_uuid'])
+        if (ref[0] not in self.networks.values() or
+                ref[1] not in self.rts.values()):
+            raise oc_exc.OpenContrailAPINotFound(resource='Ref Update',
+                                                 id='')
+        if kwargs['operation'] == 'ADD':
+            self.refs.add(ref)
+        else:
+            self.refs.discard(ref)
+        self.ref_updates.append((kwargs['operation'],
+                                 kwargs['resource_uuid'],
+                                 kwargs['ref_uuid']))
+
+    def kv_store(self, operation, key=None, value=None):
+        if operation == 'RETRIEVE':
+            if key is None:
+                return [{'key': k, 'value': v} for k, v in self.kv.items()]
+            if key not in self.kv:
+                raise oc_exc.OpenContrailAPINotFound(
+                    resource='Key Value Store', id=key)
+            return self.kv[key]
+        elif operation == 'STORE':
+            self.kv[key] = json.dumps(value)
+        elif operation == 'DELETE':
+            self.kv.pop(key, None)
+
+
+class TestOpenContrailDriver(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOpenContrailDriver, self).setUp()
+        self.useFixture(lockutils_fixture.ExternalLockFixture())
+
+        self.fake_client = FakeOpenContrailClient()
+        self.oc_client = mock.Mock(wraps=self.fake_client)
+        self.driver = opencontrail.OpenContrailBGPVPNDriver(mock.Mock())
+        mock.patch.object(self.driver, '_get_opencontrail_api_client',
+                          return_value=self.oc_client).start()
+
+        self.admin_ctx = context.get_admin_context()
+        self.ctx1 = context.Context('user', 'tenant1', is_admin=False)
+        self.ctx2 = context.Context('user', 'tenant2', is_admin=False)
+
+    def _create_bgpvpn(self, ctx, **kwargs):
+        bgpvpn = {'name': '',
+                  'type': 'l3',
+                  'route_targets': ['64512:1'],
+                  'import_targets': [],
+                  'export_targets': [],
+                  'route_distinguishers': [],
+                  'auto_aggregate': False}
+        bgpvpn.update(kwargs)
+        return self.driver.create_bgpvpn(ctx, {'bgpvpn': bgpvpn})
+
+    def _assert_no_kv_scan(self):
+        self.assertNotIn(mock.call('RETRIEVE'),
+                         self.oc_client.kv_store.call_args_list)
+
+    def test_get_bgpvpns_tenant_index(self):
+        id1 = self._create_bgpvpn(self.ctx1)['id']
+        id2 = self._create_bgpvpn(self.ctx1)['id']
+        id3 = self._create_bgpvpn(self.ctx2)['id']
+        self.oc_client.kv_store.reset_mock()
+
+        self.assertEqual(
+            set([id1, id2]),
+            set(b['id'] for b in self.driver.get_bgpvpns(self.ctx1)))
+        self.assertEqual(
+            [id3], [b['id'] for b in self.driver.get_bgpvpns(
+                self.admin_ctx, filters={'tenant_id': ['tenant2']})])
+        self._assert_no_kv_scan()
+
+        self.driver.delete_bgpvpn(self.ctx1, id1)
+        self.assertEqual(
+            [id2], [b['id'] for b in self.driver.get_bgpvpns(self.ctx1)])
+
+    def test_get_bgpvpns_builds_missing_indexes(self):
+        id1 = self._create_bgpvpn(self.ctx1)['id']
+        # BGPVPN stored before indexes existed
+        for key in list(self.fake_client.kv):
+            if key.startswith(opencontrail.BGPVPN_INDEX_KEY):
+                del self.fake_client.kv[key]
+
+        self.assertEqual(
+            [id1], [b['id'] for b in self.driver.get_bgpvpns(self.ctx1)])
+        self.assertIn(opencontrail.TENANT_BGPVPN_INDEX_KEY % 'tenant1',
+                      self.fake_client.kv)
+        self.assertEqual([], self.driver.get_bgpvpns(self.ctx2))
+
+    def test_get_bgpvpns_admin_reconciles_indexes(self):
+        id1 = self._create_bgpvpn(self.ctx1)['id']
+        id2 = self._create_bgpvpn(self.ctx1)['id']
+        # entry lost by concurrent index updates
+        for key in (opencontrail.BGPVPN_INDEX_KEY,
+                    opencontrail.TENANT_BGPVPN_INDEX_KEY % 'tenant1'):
+            self.fake_client.kv[key] = json.dumps({'bgpvpn_ids': [id1]})
+        self.oc_client.kv_store.reset_mock()
+
+        self.assertEqual(
+            set([id1, id2]),
+            set(b['id'] for b in self.driver.get_bgpvpns(self.admin_ctx)))
+        # a single scan for all the BGPVPNs
+        self.assertEqual(
+            1, self.oc_client.kv_store.call_args_list.count(
+                mock.call('RETRIEVE')))
+        self.assertEqual(
+            set([id1, id2]),
+            set(b['id'] for b in self.driver.get_bgpvpns(self.ctx1)))
+
+    def test_get_bgpvpns_admin_reconciles_tenant_index(self):
+        id1 = self._create_bgpvpn(self.ctx1)['id']
+        id2 = self._create_bgpvpn(self.ctx1)['id']
+        id3 = self._create_bgpvpn(self.ctx2)['id']
+        # entry of a tenant index lost by concurrent index updates, the
+        # global index being right
+        key = opencontrail.TENANT_BGPVPN_INDEX_KEY % 'tenant1'
+        self.fake_client.kv[key] = json.dumps({'bgpvpn_ids': [id2]})
+
+        self.assertEqual(
+            set([id1, id2, id3]),
+            set(b['id'] for b in self.driver.get_bgpvpns(self.admin_ctx)))
+        self.oc_client.kv_store.reset_mock()
+        self.assertEqual(
+            set([id1, id2]),
+            set(b['id'] for b in self.driver.get_bgpvpns(self.ctx1)))
+        self.assertEqual(
+            [id3], [b['id'] for b in self.driver.get_bgpvpns(self.ctx2)])
+        self._assert_no_kv_scan()
+
+
+class TestOpenContrailBGPVPNAssociation(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOpenContrailBGPVPNAssociation, self).setUp()
+        self.oc_client = FakeOpenContrailClient()
+        self.driver = opencontrail.OpenContrailBGPVPNDriver(mock.Mock())
+        self.bgpvpn = {'id': 'bgpvpn-id',
+                       'type': 'l3',
+                       'route_targets': ['64512:1'],
+                       'import_targets': ['64512:2'],
+                       'export_targets': [],
+                       'networks': []}
+
+    def _add_networks(self, count):
+        network_ids = ['net-%d' % i for i in range(count)]
+        for network_id in network_ids:
+            self.oc_client.networks[network_id] = 'ri-%s' % network_id
+        return network_ids
+
+    def test_set_bgpvpn_association_concurrent(self):
+        self.config(api_concurrency=4, group='opencontrail_bgpvpn')
+        network_ids = self._add_networks(10)
+
+        with mock.patch.object(opencontrail.eventlet, 'GreenPool',
+                               wraps=eventlet.GreenPool) as mock_pool:
+            self.driver._set_bgpvpn_association(self.oc_client, 'ADD',
+                                                self.bgpvpn, network_ids)
+
+        mock_pool.assert_called_once_with(4)
+        self.assertEqual(
+            sorted(('ADD', 'ri-%s' % network_id, rt_uuid)
+                   for network_id in network_ids
+                   for rt_uuid in ('rt-64512:1', 'rt-64512:2')),
+            sorted(self.oc_client.ref_updates))
+        self.assertEqual(4, self.oc_client.in_flight[1])
+
+    def test_set_bgpvpn_association_defaults_to_bgpvpn_networks(self):
+        self.bgpvpn['networks'] = self._add_networks(2)
+
+        self.driver._set_bgpvpn_association(self.oc_client, 'DELETE',
+                                            self.bgpvpn)
+
+        self.assertEqual(
+            set(['ri-net-0', 'ri-net-1']),
+            set(ri_id for _op, ri_id, _rt in self.oc_client.ref_updates))
+
+    def test_set_bgpvpn_association_one_error(self):
+        network_ids = self._add_networks(3) + ['unknown-net']
+
+        self.assertRaises(n_exc.NetworkNotFound,
+                          self.driver._set_bgpvpn_association,
+                          self.oc_client, 'ADD', self.bgpvpn, network_ids)
+        # the other networks are associated all the same
+        self.assertEqual(6, len(self.oc_client.ref_updates))
+
+    def test_set_bgpvpn_association_several_errors(self):
+        network_ids = (self._add_networks(3) +
+                       ['unknown-net-1', 'unknown-net-2'])
+
+        e = self.assertRaises(oc_exc.OpenContrailBGPVPNAssociationFailed,
+                              self.driver._set_bgpvpn_association,
+                              self.oc_client, 'ADD', self.bgpvpn,
+                              network_ids)
+        self.assertIn('unknown-net-1', str(e))
+        self.assertIn('unknown-net-2', str(e))
+        self.assertEqual(6, len(self.oc_client.ref_updates))
+
+    def test_update_bgpvpn_networks_in_one_association(self):
+        old_bgpvpn = dict(self.bgpvpn, networks=['net-1', 'net-2', 'net-3'])
+        oc_client = mock.Mock()
+        mock.patch.object(self.driver, '_get_opencontrail_api_client',
+                          return_value=oc_client).start()
+        mock.patch.object(self.driver, 'get_bgpvpn',
+                          return_value=old_bgpvpn).start()
+        mock_set = mock.patch.object(self.driver,
+                                     '_set_bgpvpn_association').start()
+
+        self.driver.update_bgpvpn(
+            context.get_admin_context(), 'bgpvpn-id',
+            {'bgpvpn': {'networks': ['net-3', 'net-4', 'net-5']}})
+
+        self.assertEqual(2, mock_set.call_count)
+        (_c, op, bgpvpn, removed), _kw = mock_set.call_args_list[0]
+        self.assertEqual(('DELETE', old_bgpvpn), (op, bgpvpn))
+        self.assertEqual(['net-1', 'net-2'], sorted(removed))
+        (_c, op, bgpvpn, added), _kw = mock_set.call_args_list[1]
+        self.assertEqual('ADD', op)
+        self.assertEqual(['net-4', 'net-5'], sorted(added))
+
+    def test_locate_rt_cached(self):
+        rt_fq_name = ['target', '64512', '1']
+        rt_id = self.driver._locate_rt(self.oc_client, rt_fq_name)
+        self.assertEqual(rt_id,
+                         self.driver._locate_rt(self.oc_client, rt_fq_name))
+        self.assertEqual(1, self.oc_client.calls['fqname_to_id'])
+        self.assertEqual(1, self.oc_client.calls['create', 'Route Target'])
+
+    def test_delete_unused_rt(self):
+        network_ids = self._add_networks(2)
+        self.driver._set_bgpvpn_association(self.oc_client, 'ADD',
+                                            self.bgpvpn, network_ids)
+
+        # still used by the other network
+        self.driver._set_bgpvpn_association(self.oc_client, 'DELETE',
+                                            self.bgpvpn, network_ids[:1])
+        self.assertEqual(2, len(self.oc_client.rts))
+        self.assertIsNotNone(
+            self.driver._rt_uuids.get(('target', '64512', '1')))
+
+        self.driver._set_bgpvpn_association(self.oc_client, 'DELETE',
+                                            self.bgpvpn, network_ids[1:])
+        self.assertEqual({}, self.oc_client.rts)
+        self.assertIsNone(
+            self.driver._rt_uuids.get(('target', '64512', '1')))
+        self.assertIsNone(
+            self.driver._rt_uuids.get(('target', '64512', '2')))
+
+    def test_update_rt_ri_association_rt_deleted(self):
+        network_id = self._add_networks(1)[0]
+        rt_fq_name = ['target', '64512', '1']
+        self.driver._locate_rt(self.oc_client, rt_fq_name)
+        # route target deleted by another server
+        self.oc_client.rts.clear()
+
+        self.driver._update_rt_ri_association(
+            self.oc_client, 'ADD', 'ri-%s' % network_id, rt_fq_name)
+
+        self.assertEqual(2, self.oc_client.calls['fqname_to_id'])
+        self.assertEqual(2, self.oc_client.calls['create', 'Route Target'])
+        self.assertEqual(
+            set([('ri-%s' % network_id, 'rt-64512:1')]), self.oc_client.refs)
+
+    def test_set_bgpvpn_association_ri_not_found(self):
+        network_id = self._add_networks(1)[0]
+        # routing instance of the network replaced since it was cached
+        self.driver._network_ris.set(network_id, 'ri-old')
+
+        self.driver._set_bgpvpn_association(self.oc_client, 'ADD',
+                                            self.bgpvpn, [network_id])
+
+        self.assertEqual(
+            set([('ri-net-0', 'rt-64512:1'), ('ri-net-0', 'rt-64512:2')]),
+            self.oc_client.refs)
+        # the route targets were not looked up again
+        self.assertEqual(2, self.oc_client.calls['fqname_to_id'])
+        self.assertEqual(2, self.oc_client.calls['create', 'Route Target'])
+
+    def test_get_ri_id_of_network_cached(self):
+        network_id = self._add_networks(1)[0]
+        for i in range(2):
+            self.assertEqual(
+                'ri-net-0',
+                self.driver._get_ri_id_of_network(self.oc_client,
+                                                  network_id))
+        # only the routing instances of the network are requested
+        self.assertEqual(
+            [('Virtual Network', network_id, 'routing_instances')],
+            self.oc_client.shows)
+
+    def test_get_ri_id_of_network_not_found(self):
+        self.assertRaises(n_exc.NetworkNotFound,
+                          self.driver._get_ri_id_of_network,
+                          self.oc_client, 'unknown-net')
+        self.assertIsNone(self.driver._network_ris.get('unknown-net'))
+
+    def test_set_bgpvpn_association_network_deleted(self):
+        network_id = self._add_networks(1)[0]
+        self.driver._get_ri_id_of_network(self.oc_client, network_id)
+        # network deleted with its routing instance
+        del self.oc_client.networks[network_id]
+
+        self.assertRaises(n_exc.NetworkNotFound,
+                          self.driver._set_bgpvpn_association,
+                          self.oc_client, 'ADD', self.bgpvpn, [network_id])
+        self.assertIsNone(self.driver._network_ris.get(network_id))
@@ -0,0 +1,70 @@
+# Copyright (c) 2015 Cloudwatt.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from oslo_config import cfg
+
+from neutron.tests import base
+
+from networking_bgpvpn.neutron.services.service_drivers.opencontrail import \
+    opencontrail_client
+
+# registered by the OpenContrail core plugin
+cfg.CONF.register_opts([cfg.StrOpt('api_server_ip', default='127.0.0.1'),
+                        cfg.IntOpt('api_server_port', default=8082)],
+                       'APISERVER')
+
+
+class TestOpenContrailAPIClient(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOpenContrailAPIClient, self).setUp()
+        mock.patch.object(opencontrail_client, '_session', None).start()
+
+    def _get_request_headers(self, client):
+        with mock.patch.object(client._pool, 'request') as mock_request:
+            mock_request.return_value.status_code = 200
+            mock_request.return_value.content = None
+            client.get('/virtual-networks')
+        return mock_request.call_args[1]['headers']
+
+    def test_session_shared(self):
+        self.config(connection_pool_size=5, group='APISERVER')
+        client1 = opencontrail_client.OpenContrailAPIBaseClient('tenant1',
+                                                                'token1')
+        client2 = opencontrail_client.OpenContrailAPIBaseClient('tenant2',
+                                                                'token2')
+        self.assertIs(client1._pool, client2._pool)
+        adapter = client1._pool.get_adapter('http://127.0.0.1:8082')
+        self.assertEqual(5, adapter._pool_maxsize)
+
+        # tenant and token are headers of each request
+        self.assertEqual('tenant1',
+                         self._get_request_headers(client1)['X-Tenant-Name'])
+        self.assertEqual('token2',
+                         self._get_request_headers(client2)['X-Auth-Token'])
+
+    def test_keepalive(self):
+        client = opencontrail_client.OpenContrailAPIBaseClient('tenant',
+                                                               'token')
+        self.assertNotIn('Connection', self._get_request_headers(client))
+
+    def test_keepalive_disabled(self):
+        self.config(keepalive=False, group='APISERVER')
+        client = opencontrail_client.OpenContrailAPIBaseClient('tenant',
+                                                               'token')
+        self.assertEqual('close',
+                         self._get_request_headers(client)['Connection'])
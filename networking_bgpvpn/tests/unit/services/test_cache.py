@@ -0,0 +1,67 @@
+# Copyright (c) 2015 Orange.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.tests import base
+
+from networking_bgpvpn.neutron.services.common import cache
+
+
+class TestLRUCache(base.BaseTestCase):
+
+    def test_lru_eviction(self):
+        lru = cache.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(1, lru.get('a'))
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(3, lru.get('c'))
+        self.assertEqual({'size': 2, 'hits': 3, 'misses': 1}, lru.stats())
+
+    @mock.patch('time.time')
+    def test_ttl(self, mock_time):
+        mock_time.return_value = 100
+        lru = cache.LRUCache(2, ttl=10)
+        lru.set('a', 1)
+        mock_time.return_value = 109
+        self.assertEqual(1, lru.get('a'))
+        mock_time.return_value = 110
+        self.assertIsNone(lru.get('a'))
+
+    def test_invalid(self):
+        lru = cache.LRUCache(2)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a', valid=lambda value: value == 2))
+        # dropped
+        self.assertIsNone(lru.get('a'))
+        lru.set('a', 2)
+        self.assertEqual(2, lru.get('a', valid=lambda value: value == 2))
+        self.assertEqual({'size': 1, 'hits': 1, 'misses': 2}, lru.stats())
+
+    def test_invalidate(self):
+        lru = cache.LRUCache(2)
+        lru.set('a', 1)
+        lru.invalidate('a')
+        lru.invalidate('b')
+        self.assertIsNone(lru.get('a'))
+
+    def test_disabled(self):
+        lru = cache.LRUCache(0)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(0, len(lru))
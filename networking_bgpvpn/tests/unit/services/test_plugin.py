@@ -137,7 +137,7 @@ class TestBGPVPNServicePlugin(BgpvpnTestCaseMixin):
             net_id = net['network']['id']
             with self.bgpvpn() as bgpvpn:
                 id = bgpvpn['bgpvpn']['id']
-                mock_validate.return_value = net['network']
+                mock_validate.return_value = [net['network']]
                 with self.assoc_net(id, net_id):
                     net_body = {'network_id': net['network']['id']}
                     mock_validate.assert_called_once_with(mock.ANY, id,
@@ -149,7 +149,7 @@ class TestBGPVPNServicePlugin(BgpvpnTestCaseMixin):
             net_id = net['network']['id']
             with self.bgpvpn() as bgpvpn:
                 id = bgpvpn['bgpvpn']['id']
-                mock_validate.return_value = net['network']
+                mock_validate.return_value = [net['network']]
                 with self.assoc_net(id, net_id, do_disassociate=False):
                     mock_validate.reset_mock()
                     net_body = {'network_id': net['network']['id']}
@@ -176,13 +176,25 @@ class TestBGPVPNServicePlugin(BgpvpnTestCaseMixin):
     def test_associate_unknown_network(self):
         with self.bgpvpn() as bgpvpn:
             id = bgpvpn['bgpvpn']['id']
-            data = {'network_id': 'unknown_uuid'}
+            data = {'network_id': _uuid()}
             assoc_req = self._req('PUT', 'bgpvpn/bgpvpns',
                                   data=data, fmt=self.fmt, id=id,
                                   action='associate_network')
             res = assoc_req.get_response(self.ext_api)
             self.assertEqual(res.status_int, webob.exc.HTTPNotFound.code)
 
+    def test_associate_invalid_network_id(self):
+        with self.bgpvpn() as bgpvpn:
+            id = bgpvpn['bgpvpn']['id']
+            for network_id in ('unknown_uuid', [['x']], [_uuid(), {}]):
+                data = {'network_id': network_id}
+                assoc_req = self._req('PUT', 'bgpvpn/bgpvpns',
+                                      data=data, fmt=self.fmt, id=id,
+                                      action='associate_network')
+                res = assoc_req.get_response(self.ext_api)
+                self.assertEqual(res.status_int,
+                                 webob.exc.HTTPBadRequest.code)
+
     def test_associate_unauthorized_net(self):
         with self.network() as net:
             net_id = net['network']['id']
@@ -212,6 +224,29 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
             mock_create_postcommit.assert_called_once_with(mock.ANY,
                                                            self.converted_data)
 
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_bgpvpn_postcommit')
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_bgpvpn_bulk_postcommit')
+    def test_create_bgpvpn_bulk(self, mock_bulk_postcommit,
+                                mock_create_postcommit):
+        data = {'bgpvpns': [copy.deepcopy(self.bgpvpn_data),
+                            copy.deepcopy(self.bgpvpn_data)]}
+        bulk_req = self.new_create_request('bgpvpn/bgpvpns', data, fmt='json')
+        res = bulk_req.get_response(self.ext_api)
+        self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+        bgpvpns = self.deserialize('json', res)['bgpvpns']
+        self.assertEqual(2, len(bgpvpns))
+
+        self.assertEqual(1, mock_bulk_postcommit.call_count)
+        self.assertEqual(set(bgpvpn['id'] for bgpvpn in bgpvpns),
+                         set(bgpvpn['id'] for bgpvpn in
+                             mock_bulk_postcommit.call_args[0][1]))
+        self.assertFalse(mock_create_postcommit.called)
+
+        for bgpvpn in bgpvpns:
+            self._delete('bgpvpn/bgpvpns', bgpvpn['id'])
+
     @mock.patch.object(driver_api.BGPVPNDriver,
                        'delete_bgpvpn_postcommit')
     def test_delete_bgpvpn(self, mock_delete_postcommit):
@@ -274,9 +309,9 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                 mock.ANY, old_bgpvpn, new_bgpvpn)
 
     @mock.patch.object(driver_api.BGPVPNDriver,
-                       'associate_network_postcommit')
+                       'associate_networks_postcommit')
     @mock.patch.object(bgpvpn_db.BGPVPNPluginDb,
-                       'associate_network')
+                       'associate_networks')
     def test_associate_network(self, mock_assoc_db, mock_assoc_postcommit):
         with self.network() as net:
             net_id = net['network']['id']
@@ -285,16 +320,36 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                 with self.assoc_net(id, net_id=net_id):
                     mock_assoc_db.assert_called_once_with(mock.ANY,
                                                           id,
-                                                          net_id)
+                                                          [net_id])
+
+                    mock_assoc_postcommit.assert_called_once_with(mock.ANY,
+                                                                  id,
+                                                                  [net_id])
 
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'associate_networks_postcommit')
+    def test_associate_networks(self, mock_assoc_postcommit):
+        with self.network() as net1, self.network() as net2:
+            net_ids = [net1['network']['id'], net2['network']['id']]
+            with self.bgpvpn() as bgpvpn:
+                id = bgpvpn['bgpvpn']['id']
+                with self.assoc_net(id, net_id=net_ids):
                     mock_assoc_postcommit.assert_called_once_with(mock.ANY,
                                                                   id,
-                                                                  net_id)
+                                                                  mock.ANY)
+                    self.assertEqual(
+                        set(net_ids),
+                        set(mock_assoc_postcommit.call_args[0][2]))
+                    res = self._show('bgpvpn/bgpvpns', id)
+                    self.assertEqual(set(net_ids),
+                                     set(res['bgpvpn']['networks']))
+                res = self._show('bgpvpn/bgpvpns', id)
+                self.assertEqual([], res['bgpvpn']['networks'])
 
     @mock.patch.object(driver_api.BGPVPNDriver,
-                       'disassociate_network_postcommit')
+                       'disassociate_networks_postcommit')
     @mock.patch.object(bgpvpn_db.BGPVPNPluginDb,
-                       'disassociate_network')
+                       'disassociate_networks')
     def test_disassociate_network(self, mock_disassoc_db,
                                   mock_disassoc_postcommit):
         with self.network() as net:
@@ -310,8 +365,8 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                     raise webob.exc.HTTPClientError(code=res.status_int)
                 mock_disassoc_db.assert_called_once_with(mock.ANY,
                                                          id,
-                                                         net_id)
+                                                         [net_id])
 
                 mock_disassoc_postcommit.assert_called_once_with(mock.ANY,
                                                                  id,
-                                                                 net_id)
+                                                                 [net_id])